@@ -1,8 +1,9 @@
 """P3, Yue Yu, cpsc 5910, R18, Seattle University
 
 Classes:
-TimeSeries - class to hold a date/value series of data
-Fred - a time series that is based on a csv file downloaded from p3
+TimeSeries, Fred, Frame - see Time Series/SeriesData.py (Fred's csv files
+       are parsed once and cached beside them, and series are shared
+       through its registry)
 USDForex-take the reciprical of values,
          has subclasses of foreign exchange series: chy, inr,krw,mxn,myr
 USDCommodity-replicate prior days' values for all weekdays within the range
@@ -12,88 +13,31 @@ Basket-investigate various proxy baskets (subsets of the whole risk basket)
 """
 
 import os
-import csv
+import sys
 from datetime import datetime, timedelta
 import numpy as np
 import itertools
 
-DATA=os.getcwd()
+# the series classes, loaders, registry and Frame are shared with
+# Time Series/TimeSeries.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Time Series'))
+from SeriesData import Fred, Frame
 
-class TimeSeries(object):
-    """Holds a date/value series of data"""
-    def __init__(self, name, title=None, unit=None):
-        self.name = name
-        self.title = title
-        self.unit = unit
-        self.data = {}
-        self.first_date = None
-        self.last_date = None
-
-    def get_dates(self, candidates=None, start=None, end=None):
-        """Get the dates where this series has values
-        ts.get_dates() - gets all dates where ts has values
-        ts.get_dates(start=d1,end=d2) - get all valid dates, d, 
-                                        where d1<=d<=d2
-        ts.get_dates(candidates=dates) - get all valid dates, d, 
-                                         for d in dates
-        :param candidates: if set, start and end are ignored, and 
-                           returns the subset of dates within 
-                           candidates for which this series has data
-        :param start:      minimum starting date of returned dates, 
-                           defaults to beginning of this series
-        :param end:        max ending date of returned dates, 
-                           defaults to end of this series
-        :return:           a list of dates, in order, for which
-                           this series has values and that satisfy
-                           the parameters' conditions
-        """
-        if candidates is not None:
-            return [date for date in candidates if date in self.data]
-        if start is None:
-            start = self.first_date
-        if end is None:
-            end = self.last_date
-        return [date for date in self.data if start <= date <= end]
-
-    def get_values(self, dates):
-        """Get the values for the specified dates.
-        :param dates:      list of dates to get values for
-        :return:           the values for the given dates in the same order
-        :raises: KeyError  if any requested date has no value
-        """
-        ret = []
-        for d in dates:
-            ret.append(self.data[d])
-        return ret
-
-
-class Fred(TimeSeries):
-    def __init__(self, name, title=None, unit=None, data_column=None):
-        """Opens and reads the csv file in DATA/name.csv"""
-        super().__init__(name.lower(), title, unit)
-        filename = os.path.join(DATA, name + '.csv')
-        if data_column is None:
-            data_column = name
-        with open(filename) as csv_file:
-            reader = csv.DictReader(csv_file)
-            for row in reader:
-                try:
-                    value = float(row[data_column])
-                except ValueError:
-                    continue
-                date = datetime.strptime(row['DATE'], "%Y-%m-%d")
-                self.data[date] = value
-        self.first_date = min(self.data)
-        self.last_date = max(self.data)
+DAY = np.timedelta64(1, 'D')
 
 
 class USDForex(Fred):
     """take the reciprical of values"""
     def __init__(self, data_column):
-        super().__init__('fx_' + self.__class__.__name__, unit='USD', data_column=data_column)
-        self.data = {d: 1/self.data[d] for d in self.data}
+        super().__init__('fx_' + self.__class__.__name__, unit='USD', column=data_column)
+        self._store(self.dates, 1 / self.values)
         self.name = self.__class__.__name__
 
+    def parse_lines(self, lines):
+        """(dates, reciprocal values) of data lines of the csv file"""
+        dates, values = super().parse_lines(lines)
+        return dates, 1 / values
+
 class chy(USDForex):
     """Foreign exchange series of chy"""
     def __init__(self):
@@ -122,17 +66,11 @@ class myr(USDForex):
 class USDCommodity(Fred):
     """replicate prior days' values for all weekdays"""
     def __init__(self, name, data_column):
-        super().__init__('cmdty_' + self.__class__.__name__, unit='USD', data_column=data_column)
-        data = {}
-        d = self.first_date
-        last_value = self.data[d]
-        while d <= self.last_date:
-            if d in self.data:
-                last_value=self.data[d]
-            if d.weekday() < 5:  # Mon - Fri
-                data[d]=last_value
-            d += timedelta(days=1)
-        self.data = data
+        super().__init__('cmdty_' + self.__class__.__name__, unit='USD', column=data_column)
+        days = np.arange(self.dates[0], self.dates[-1] + DAY, DAY)
+        days = days[np.is_busday(days.astype('datetime64[D]'))]  # Mon - Fri
+        self._store(days, self.values[np.searchsorted(self.dates, days, 'right') - 1])
+        self.filename = None   # the filled-in days aren't the file's to refresh
         self.name = name
 
 class copper(USDCommodity):
@@ -150,7 +88,8 @@ class wti(USDCommodity):
     """Commodity series of oil"""
     def __init__(self):
         super().__init__(self.__class__.__name__, 'DCOILWTICO')
- 
+
+
 class Basket(object):
     """investigate various proxy baskets (subsets of the whole risk basket)"""
     def __init__(self, baskets, weights):
@@ -167,21 +106,18 @@ class Basket(object):
             if self.last_date > basket.last_date:
                 self.last_date = basket.last_date
 
-        # get all the valid dates available in all the baskets
-        self.valid_dates = baskets[0].get_dates(start = self.first_date, end = self.last_date)
-        for i in range(1,len(baskets)):
-            self.valid_dates = baskets[i].get_dates(candidates = self.valid_dates)
+        # align all the baskets on the valid dates available in all of them
+        self.frame = Frame(baskets, start = self.first_date, end = self.last_date)
+        self.valid_dates = self.frame.dates
 
         self.basket_name_mapping = {}
         for i in range(len(baskets)):
             self.basket_name_mapping[baskets[i].name] = i
 
-        self.response_all = {}
-        for date in self.valid_dates:
-            response = 0
-            for i in range(len(baskets)):
-                response += baskets[i].data[date] * self.weights[i]
-            self.response_all[date] = response
+        # weighted sum of the baskets on each valid date
+        self.response_all = np.zeros(len(self.valid_dates))
+        for i in range(len(baskets)):
+            self.response_all = self.response_all + self.frame.column(i) * self.weights[i]
 
     def regression(self, basket_names,first=None,last=None):
         m_subset = len(basket_names)
@@ -194,13 +130,13 @@ class Basket(object):
             last = self.last_date
         else:
             last = min(last, self.last_date)
-        dates = [date for date in self.valid_dates if first <= date <= last]
+        rows = self.frame.rows(first, last)
         predictors_T = []
-        response = [self.response_all[date] for date in dates]
+        response = self.response_all[rows]
         for basket_name in basket_names:
             column_index = self.basket_name_mapping[basket_name]
-            predictors_T.append(self.baskets[column_index].get_values(dates))
-        intercept_column=np.empty(len(dates)); 
+            predictors_T.append(self.frame.column(column_index)[rows])
+        intercept_column=np.empty(len(response)); 
         intercept_column.fill(1/np.sqrt(m_subset))
         predictors_T.append(intercept_column)
 
@@ -247,8 +183,8 @@ class Basket(object):
         result = self.best_regression_n(k, last = split_date)
         first_day = split_date + timedelta(days=1)
         
-        dates = [date for date in self.valid_dates if first_day <= date]
-        response = [self.response_all[date] for date in dates]
+        rows = self.frame.rows(first_day)
+        response = self.response_all[rows]
 
         basket_names = []
         suggested_hedges = []
@@ -260,7 +196,7 @@ class Basket(object):
         holdout_T = []
         for basket_name in basket_names:
             column_index = self.basket_name_mapping[basket_name]
-            holdout_T.append(self.baskets[column_index].get_values(dates))
+            holdout_T.append(self.frame.column(column_index)[rows])
 
         big_x_T = np.matrix(holdout_T, )
         big_x = big_x_T.T
@@ -0,0 +1,220 @@
+"""BatchSim, Yue Yu, cpsc 5910, R18, Seattle University
+
+simulate_batch(player) - simulate many independent evenings of blackjack at
+                         once with NumPy arrays instead of Card objects
+compile_settlement(player, dealer) - win/lose/push table for final hands
+"""
+import numpy as np
+from Shoe import VALUES, SYSTEMS
+from StrategyTable import StrategyTable, card, STAY, DOUBLE, MULTI, TWO, PAIR
+
+# settlement index for a busted hand and for a blackjack (other indexes
+# are the hand's total)
+BUST, BLACKJACK = 0, 22
+
+
+def compile_settlement(player, dealer):
+    """Outcome of every pair of final hands, found by asking the player's and
+    dealer's beats methods the way simulate() does.
+    :return: int8 array indexed by [player final, dealer final] holding 1
+             for a win, -1 for a loss and 0 for a push; finals are BUST,
+             BLACKJACK or the hand's total
+    """
+    finals = {BUST: (10, 10, 5), BLACKJACK: (11, 10), 21: (10, 9, 2)}
+    for total in range(4, 21):
+        finals[total] = (min(10, total - 2), total - min(10, total - 2))
+    table = np.zeros((23, 23), dtype=np.int8)
+    for p, p_values in finals.items():
+        for d, d_values in finals.items():
+            player.dealt([card(v) for v in p_values])
+            dealer.dealt([card(v) for v in d_values])
+            if player.beats(dealer):
+                table[p, d] = 1
+            elif dealer.beats(player):
+                table[p, d] = -1
+    return table
+
+
+def simulate_batch(player,
+                   dealer,
+                   trials,
+                   hands=100,
+                   ndecks=6,
+                   penetration=0.7,
+                   nplayers=7,
+                   seed=None,
+                   tables=None):
+    """simulate many evenings of blackjack at once, each with its own shoe
+    Plays by the same rules as p1.simulate() (dealing order, reshuffle
+    point, doubling, dealer peeking for blackjack) but holds every shoe as
+    a row of card values and plays one hand of every trial per step.
+    :param player:      Blackjack object representing the player
+    :param dealer:      Blackjack object representing the dealer
+    :param trials:      Number of independent evenings to simulate
+    :param hands:       Number of hands in each evening
+    :param ndecks:      Number of decks in each shoe
+    :param penetration: Depth of shoe before reshuffling
+    :param nplayers:    Number of other players present (cards dealt only)
+    :param seed:        seed for numpy.random.default_rng
+    :param tables:      (player, dealer) StrategyTable objects (compiled
+                        from player and dealer if None)
+    :return: (final, lo, hi) arrays of each trial's accumulated winnings
+    """
+    rng = np.random.default_rng(seed)
+    if tables is None:
+        tables = (StrategyTable.compile(player), StrategyTable.compile(dealer))
+    settlement = compile_settlement(player, dealer)
+    player_table = tables[0].table
+    dealer_table = tables[1].table[tables[1].bucket(0)]
+    player.new_shoe()
+    dealer.new_shoe()
+
+    shoe_size = 52 * ndecks
+    base = np.tile(VALUES, ndecks)
+    shoes = rng.permuted(np.tile(base, (trials, 1)), axis=1)
+    pos = np.zeros(trials, dtype=np.intp)
+    rows = np.arange(trials)
+
+    # a player watching the shoe (see p1.CardCounting) counts every card
+    # dealt: its running count is a prefix sum of tags along each shoe, and
+    # its bets are looked up from what bet() says at every possible count.
+    # Anyone else's count and bet don't change during a shoe.
+    counting = hasattr(player, 'watch')
+    if counting:
+        tags = SYSTEMS[player.system]
+        prefix = np.zeros((trials, shoe_size + 1), dtype=np.int64)
+        np.cumsum(tags[shoes], axis=1, out=prefix[:, 1:])
+        bound = int(np.abs(tags[base]).sum())
+        bets = _bets(player, range(-bound, bound + 1))
+    else:
+        wager = player.bet()
+        bucket = np.full(trials, tables[0].bucket(getattr(player, 'count', 0)))
+
+    final = np.zeros(trials, dtype=np.int64)
+    lo = np.full(trials, 10000, dtype=np.int64)
+    hi = np.full(trials, -10000, dtype=np.int64)
+
+    for i in range(hands):
+        if counting:
+            money = bets[prefix[rows, pos] + bound]
+        else:
+            money = np.full(trials, wager, dtype=np.int64)
+
+        # both rounds of the deal; other players' cards are only skipped
+        p1 = shoes[rows, pos + nplayers]
+        up = shoes[rows, pos + nplayers + 1]
+        p2 = shoes[rows, pos + 2 * nplayers + 2]
+        hole = shoes[rows, pos + 2 * nplayers + 3]
+        pos += 2 * nplayers + 4
+        if counting:
+            # the count before the hole card, which is still face down
+            bucket = tables[0].bucket(prefix[rows, pos - 1])
+
+        player_hand = _Hands(p1, p2)
+        dealer_hand = _Hands(up, hole)
+        dealer_bj = dealer_hand.blackjack()
+        player_bj = player_hand.blackjack()
+
+        # player
+        live = ~dealer_bj
+        while live.any():
+            idx = np.flatnonzero(live)
+            choice = player_hand.choices(player_table, up, idx, bucket)
+            stay = choice == STAY
+            double = choice == DOUBLE
+            live[idx[stay]] = False
+            idx = idx[~stay]
+            money[idx[double[~stay]]] *= 2
+            player_hand.hit(idx, shoes[idx, pos[idx]])
+            pos[idx] += 1
+            live[idx[double[~stay] | player_hand.busted(idx)]] = False
+
+        # dealer
+        live = ~dealer_bj
+        while live.any():
+            idx = np.flatnonzero(live)
+            stay = dealer_hand.choices(dealer_table, up, idx) == STAY
+            live[idx[stay]] = False
+            idx = idx[~stay]
+            dealer_hand.hit(idx, shoes[idx, pos[idx]])
+            pos[idx] += 1
+            live[idx[dealer_hand.busted(idx)]] = False
+
+        # compare
+        outcome = settlement[player_hand.finals(), dealer_hand.finals()]
+        outcome[dealer_bj] = np.where(player_bj[dealer_bj], 0, -1)
+        final += outcome * money
+        np.minimum(lo, final, out=lo)
+        np.maximum(hi, final, out=hi)
+
+        reshuffle = np.flatnonzero(shoe_size - pos < penetration * shoe_size)
+        if len(reshuffle):
+            shoes[reshuffle] = rng.permuted(shoes[reshuffle], axis=1)
+            pos[reshuffle] = 0
+            if counting:
+                prefix[reshuffle, 1:] = np.cumsum(tags[shoes[reshuffle]],
+                                                  axis=1)
+
+    return (final, lo, hi)
+
+
+def _bets(player, counts):
+    """array of the player's bet at each count, from a player watching a
+    shoe (which is set aside while asking)"""
+    shoe = player.shoe
+    player.watch(None)
+    bets = []
+    for count in counts:
+        player.count = count
+        bets.append(player.bet())
+    player.new_shoe()
+    player.watch(shoe)
+    return np.array(bets, dtype=np.int64)
+
+
+class _Hands(object):
+    """One blackjack hand per trial, kept as running totals"""
+
+    def __init__(self, first, second):
+        self.hard = (first % 11 + second % 11 + (first == 11) +
+                     (second == 11)).astype(np.int64)
+        self.aces = (first == 11) | (second == 11)
+        self.ncards = np.full(len(first), 2)
+        self.pair = first == second
+
+    def totals(self, idx=slice(None)):
+        """(soft, total) of the selected hands, counting an ace as 11 when
+        that doesn't bust them"""
+        hard = self.hard[idx]
+        soft = self.aces[idx] & (hard <= 11)
+        return soft, np.where(soft, hard + 10, hard)
+
+    def choices(self, table, up, idx, bucket=None):
+        """decision table entries for the selected hands (table has a count
+        bucket axis first when bucket is given)"""
+        soft, total = self.totals(idx)
+        kind = np.where(self.ncards[idx] > 2, MULTI,
+                        np.where(self.pair[idx], PAIR, TWO))
+        cell = (soft.astype(np.intp), np.minimum(total, 21), kind, up[idx])
+        if bucket is not None:
+            cell = (bucket[idx],) + cell
+        return table[cell]
+
+    def hit(self, idx, cards):
+        """add a card to each of the selected hands"""
+        self.hard[idx] += np.where(cards == 11, 1, cards)
+        self.aces[idx] |= cards == 11
+        self.ncards[idx] += 1
+
+    def busted(self, idx=slice(None)):
+        return self.hard[idx] > 21
+
+    def blackjack(self):
+        soft, total = self.totals()
+        return (self.ncards == 2) & (total == 21)
+
+    def finals(self):
+        """settlement index of every hand"""
+        soft, total = self.totals()
+        return np.where(self.busted(), BUST,
+                        np.where(self.blackjack(), BLACKJACK, total))
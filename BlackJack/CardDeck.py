@@ -1,36 +1,57 @@
 """CardDeck, Yue Yu, cpsc 5910, R18, Seattle University
 
 CardDeck - class for a deck (or several decks) of standard playing cards for card games.
+ReplayDeck - CardDeck that deals a sequence of recorded shoes instead of
+             shuffling
 """
-import random
 from Card import Card
+from Shoe import Shoe, NAMES
+
+# one shared Card object per card number in a Shoe
+CARDS = [Card(name) for name in NAMES]
 
 
 class CardDeck(object):
     """A standard 52-card deck of playing cards (or several of them)
     
     Object Data:
-        cards - list of Card objects
+        shoe - Shoe holding the deck as an array of card numbers
+        cards - list of Card objects (built from the shoe when asked for)
         top - index of last card dealt (undealt cards have index < deck.top)
+        rng - numpy.random.Generator to shuffle with (None for the global
+              random state)
     
     Methods:
-        CardDeck(n) - new deck with 52*n cards (n defaults to 1)
+        CardDeck(n, rng) - new deck with 52*n cards (n defaults to 1)
         shuffle() - replace any dealt cards and randomize the deck's order
         deal() - take off the top card (and return it)
+        deal_n(k) - take off the top k cards as an array of card numbers
+                    (see Shoe.deal_n)
         deal_random() - take an undealt card from a random spot in the deck
         count() - total number of cards (52*n)
         dealt() - number of cards that have been dealt since last shuffle
         undealt() - number of cards that have yet to be dealt
     """
 
-    def __init__(self, num_decks=1):
+    def __init__(self, num_decks=1, rng=None):
         """Starts as sorted deck of undealt cards"""
-        self.cards = []
-        for i in range(num_decks):
-            for suit in Card.suits:
-                for rank in Card.ranks:
-                    self.cards.append(Card(rank + suit))
-        self.top = len(self.cards)  # top is the index of the last dealt card
+        self.shoe = Shoe(num_decks, rng)
+
+    @property
+    def cards(self):
+        return [CARDS[i] for i in self.shoe.cards]
+
+    @property
+    def top(self):
+        return self.shoe.top
+
+    @top.setter
+    def top(self, top):
+        self.shoe.top = top
+
+    @property
+    def rng(self):
+        return self.shoe.rng
 
     def __str__(self):
         """The list of cards from bottom of the deck to top followed by
@@ -38,7 +59,7 @@ class CardDeck(object):
         >>> str(CardDeck())
         "['2S', '3S', '4S', '5S', '6S', '7S', '8S', '9S', 'TS', 'JS', 'QS', 'KS', 'AS', '2H', '3H', '4H', '5H', '6H', '7H', '8H', '9H', 'TH', 'JH', 'QH', 'KH', 'AH', '2C', '3C', '4C', '5C', '6C', '7C', '8C', '9C', 'TC', 'JC', 'QC', 'KC', 'AC', '2D', '3D', '4D', '5D', '6D', '7D', '8D', '9D', 'TD', 'JD', 'QD', 'KD', 'AD']/52"
         """
-        ret = [str(card) for card in self.cards]
+        ret = [NAMES[i] for i in self.shoe.cards]
         return str(ret) + '/' + str(self.top)
 
     def __repr__(self):
@@ -49,40 +70,66 @@ class CardDeck(object):
         None is returned if there are no more cards.
         (Note: you can reset the deck with the shuffle method.)
         """
-        if self.top == 0:
-            return None
-        self.top -= 1
-        return self.cards[self.top]
+        i = self.shoe.deal()
+        return None if i is None else CARDS[i]
+
+    def deal_n(self, k):
+        """Remove the next k cards and return their card numbers (a view
+        into the shoe; see Shoe.deal_n)."""
+        return self.shoe.deal_n(k)
 
     def undealt(self):
         """Number of cards left to deal."""
-        return self.top
+        return self.shoe.undealt()
 
     def dealt(self):
         """Number of cards already dealt."""
-        return len(self.cards) - self.top
+        return self.shoe.dealt()
 
     def count(self):
         """Total number of cards in the deck--both dealt and undealt."""
-        return len(self.cards)
+        return self.shoe.count()
 
     def deal_random(self):
         """Deal a card selected randomly from the undealt cards."""
-        if self.top == 0:
-            return None
-        pick = random.randint(0, self.top - 1)
-        # swap picked card with top card
-        self.top -= 1
-        self.cards[pick], self.cards[self.top] = (self.cards[self.top],
-                                                  self.cards[pick])
-        return self.cards[self.top]
+        i = self.shoe.deal_random()
+        return None if i is None else CARDS[i]
 
     def shuffle(self):
         """Randomly reorder the deck and reset it to be all undealt."""
-        self.top = len(self.cards)
-        card = self.deal_random()
-        while card is not None:
-            card = self.deal_random()
-        self.top = len(self.cards)
+        self.shoe.shuffle()
+
+
+class ReplayDeck(CardDeck):
+    """A CardDeck whose shuffle() puts the next of a sequence of shoe orders
+    in place instead of randomizing, so a simulation can be dealt the shoes
+    recorded by a HandRecorder (see HandRecorder.shoes)
 
-        
+    Object Data:
+        orders - array with one row of card numbers per shoe
+        next - row to use at the next shuffle
+        cycle - whether to go back to the first row after the last
+    """
+
+    def __init__(self, orders, start=0, cycle=False):
+        """
+        :param orders: 2-D array of card numbers, 52*n per row
+        :param start:  first row to deal
+        :param cycle:  start over from row 0 when every row has been dealt
+                       (otherwise shuffle() raises IndexError)
+        """
+        super().__init__(len(orders[0]) // 52)
+        self.orders = orders
+        self.next = start
+        self.cycle = cycle
+
+    def shuffle(self):
+        """Load the next recorded shoe and reset it to be all undealt.
+        IndexError is raised when every shoe has been used (unless
+        cycling)."""
+        if self.cycle:
+            self.next %= len(self.orders)
+        if self.next >= len(self.orders):
+            raise IndexError('no more recorded shoes')
+        self.shoe.arrange(self.orders[self.next])
+        self.next += 1
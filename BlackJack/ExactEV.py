@@ -0,0 +1,327 @@
+"""ExactEV, Yue Yu, cpsc 5910, R18, Seattle University
+
+ExactEV - exact expected winnings of blackjack hands for a shoe composition,
+          played by the same rules as p1.simulate()
+shoe(ndecks, removed) - rank counts of a shoe with some cards removed
+"""
+from collections import OrderedDict
+import numpy as np
+from Blackjack import Soft17
+from BatchSim import compile_settlement, BUST, BLACKJACK
+from StrategyTable import StrategyTable, STAY, HIT, DOUBLE, MULTI, TWO, PAIR
+
+# a shoe composition is a tuple of how many cards of each blackjack value
+# are left: counts[i] is the number of cards with value i + 2 (so
+# counts[8] is tens and faces, counts[9] aces)
+
+
+def shoe(ndecks=6, removed=()):
+    """Rank counts of ndecks decks with the given card values removed
+    >>> shoe(1, removed=[11, 10, 10])
+    (4, 4, 4, 4, 4, 4, 4, 4, 14, 3)
+    """
+    counts = [4 * ndecks] * 8 + [16 * ndecks, 4 * ndecks]
+    for value in removed:
+        counts[value - 2] -= 1
+    return tuple(counts)
+
+
+def _draw(counts):
+    """Yield (value, probability, counts after drawing it) for every value
+    left in the shoe"""
+    total = sum(counts)
+    for i, n in enumerate(counts):
+        if n:
+            yield i + 2, n / total, counts[:i] + (n - 1,) + counts[i + 1:]
+
+
+def _add(state, value):
+    """(hard, ace, kind) after adding a card value to a hand's state"""
+    hard, ace, kind = state
+    return hard + (1 if value == 11 else value), ace or value == 11, MULTI
+
+
+def _start(first, second):
+    """(hard, ace, kind) of a two-card hand"""
+    hard = (1 if first == 11 else first) + (1 if second == 11 else second)
+    return hard, 11 in (first, second), PAIR if first == second else TWO
+
+
+def _cell(state):
+    hard, ace, kind = state
+    soft = ace and hard <= 11
+    return int(soft), hard + 10 if soft else hard, kind
+
+
+def _final(state):
+    """settlement index of a finished hand"""
+    soft, total, kind = _cell(state)
+    if state[0] > 21:
+        return BUST
+    if kind != MULTI and total == 21:
+        return BLACKJACK
+    return total
+
+
+def _at_count(player, count):
+    """(StrategyTable, bet) of a player at a count, setting aside any shoe
+    it watches while asking (players that don't count play and bet as
+    they are)"""
+    if not hasattr(player, 'count'):
+        return StrategyTable.compile(player), player.bet()
+    shoe = getattr(player, 'shoe', None)
+    if shoe is not None:
+        player.watch(None)
+    saved = player.count
+    table = StrategyTable.compile(player, counts=[count])
+    player.count = count
+    bet = player.bet()
+    player.count = saved
+    if shoe is not None:
+        player.watch(shoe)
+    return table, bet
+
+
+class _Memo(object):
+    """A function's results by arguments, least recently used first out
+    once they take more than max_bytes (each entry counted as ENTRY bytes
+    plus the size of any array it holds)"""
+    ENTRY = 200
+
+    def __init__(self, function, max_bytes):
+        self.function = function
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = self.misses = 0
+
+    def __call__(self, *key):
+        entries = self.entries
+        try:
+            value = entries[key]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            entries.move_to_end(key)
+            return value
+        self.misses += 1
+        value = self.function(*key)
+        entries[key] = value
+        self.bytes += self.ENTRY + getattr(value, 'nbytes', 0)
+        while self.bytes > self.max_bytes and len(entries) > 1:
+            old_key, old = entries.popitem(last=False)
+            self.bytes -= self.ENTRY + getattr(old, 'nbytes', 0)
+        return value
+
+    def info(self):
+        """dict of hits, misses, entries and bytes"""
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self.entries), 'bytes': self.bytes}
+
+
+# most cards of one value a dealer's hand can draw, plus one
+WIDTH = 13
+_STEPS = np.arange(WIDTH - 1)
+_TOTAL_STEPS = np.arange(2 * WIDTH - 1)
+
+
+def _dealer_hands(cells, up):
+    """(factors, ways, lengths, finals) grouping every way a dealer playing
+    by a table's cells goes on from an upcard, hole card first, leaving out
+    dealer blackjacks. The chance of drawing a group's cards depends only
+    on how many of each value they are, so for each group there are the
+    places in a flattened (value, number drawn) table of falling
+    factorials to multiply (padded with the place after it, which holds
+    1), how many orders of the cards play out that way, how many cards
+    they are and the settlement index they end at (see
+    ExactEV._peeked_distribution)."""
+    groups = {}
+
+    def play(state, drawn):
+        soft, total, kind = _cell(state)
+        if cells[soft, total, kind, up] == STAY:
+            key = (tuple(drawn), _final(state))
+            groups[key] = groups.get(key, 0) + 1
+            return
+        for value in range(2, 12):
+            drawn[value - 2] += 1
+            after = _add(state, value)
+            if after[0] > 21:
+                key = (tuple(drawn), BUST)
+                groups[key] = groups.get(key, 0) + 1
+            else:
+                play(after, drawn)
+            drawn[value - 2] -= 1
+
+    for hole in range(2, 12):
+        state = _start(up, hole)
+        if _final(state) != BLACKJACK:
+            drawn = [0] * 10
+            drawn[hole - 2] = 1
+            play(state, drawn)
+    places = [[value * WIDTH + k for value, k in enumerate(drawn) if k]
+              for drawn, final in groups]
+    factors = np.full((len(places), max(map(len, places))), 10 * WIDTH)
+    for row, group in zip(factors, places):
+        row[:len(group)] = group
+    lengths = np.array([sum(drawn) for drawn, final in groups])
+    finals = np.array([final for drawn, final in groups])
+    return factors, np.array(list(groups.values()), dtype=float), lengths, finals
+
+
+class ExactEV(object):
+    """Exact expectations for a player strategy against a dealer strategy,
+    computed by recursing over the cards left in the shoe.
+
+    Every card dealt is drawn from the remaining composition, so results
+    are exact for the given shoe (other seats' cards are unseen, which
+    doesn't change any expectation). The order cards are drawn in doesn't
+    change their joint distribution, so the dealer's hole card is drawn
+    once the player stands, from the cards then left, counting only hole
+    cards that don't give the dealer blackjack; dividing by the chance of
+    no blackjack at the peek makes peeking exact, while the player's
+    recursion depends only on the composition, hand and upcard. The
+    dealer's play from each upcard is enumerated once, so the dealer's
+    distribution for a composition is one vectorized product.
+    Results are memoized on the remaining rank counts in LRU caches
+    bounded in bytes.
+
+    Object Data:
+        player_table, dealer_table - StrategyTable objects being played
+        count, bet - count the player plays at and its bet there
+        settlement - win/lose/push table from BatchSim.compile_settlement
+
+    Methods:
+        dealer_probabilities(counts, up) - dealer's final hands after a peek
+        decision_evs(counts, cards, up) - EV of each action for a hand
+        hand_ev(counts) - EV per unit bet of a whole hand from a fresh deal
+        expected_winnings(counts) - hand_ev times the player's bet
+        cache_info() - hit/miss and size statistics of the caches
+    """
+
+    def __init__(self, player, dealer=Soft17(), count=0, cache_bytes=256 * 2**20):
+        """
+        :param player:     Blackjack object for the player
+        :param dealer:     Blackjack object for the dealer
+        :param count:      count a counting player (one with a count, like
+                           p1.CardCounting) plays and bets at
+        :param cache_bytes: most memory the memo caches take together
+        """
+        self.player = player
+        self.player_table, self.bet = _at_count(player, count)
+        self.dealer_table = StrategyTable.compile(dealer)
+        self.settlement = compile_settlement(player, dealer).astype(float)
+        self.count = count
+        self._player_cells = self.player_table.table[0]
+        cells = self.dealer_table.table[0]
+        self._dealer_hands = {up: _dealer_hands(cells, up) for up in range(2, 12)}
+        self._peeked = _Memo(self._peeked_distribution, cache_bytes // 2)
+        self._play = _Memo(self._play_hand, cache_bytes // 2)
+
+    def cache_info(self):
+        """_Memo statistics for the dealer's distributions and the player's
+        recursion"""
+        return self._peeked.info(), self._play.info()
+
+    def _peeked_distribution(self, counts, up):
+        """probabilities of the dealer's settlement index for an upcard,
+        the hole card and hits drawn from counts, leaving out dealer
+        blackjacks (so they add up to the chance of no blackjack)"""
+        factors, ways, lengths, finals = self._dealer_hands[up]
+        n = np.array(counts, dtype=float)
+        # falling[v * WIDTH + k]: ways to draw k cards of value v + 2 in order
+        falling = np.ones(10 * WIDTH + 1)
+        table = falling[:-1].reshape(10, WIDTH)
+        np.cumprod(np.maximum(n[:, np.newaxis] - _STEPS, 0), axis=1, out=table[:, 1:])
+        # total[k]: ways to draw any k cards in order (0 only when fewer are
+        # left, and then no group that long can be drawn)
+        total = np.ones(2 * WIDTH)
+        np.cumprod(np.maximum(n.sum() - _TOTAL_STEPS, 1), out=total[1:])
+        p = ways * falling[factors].prod(axis=1) / total[lengths]
+        return np.bincount(finals, weights=p, minlength=23)
+
+    def _no_blackjack(self, counts, up):
+        """chance a hole card drawn from counts doesn't give the dealer
+        blackjack"""
+        return sum(p for value, p, rest in _draw(counts)
+                   if _final(_start(up, value)) != BLACKJACK)
+
+    def _stand(self, counts, final, up):
+        return self._peeked(counts, up) @ self.settlement[final]
+
+    def _act(self, action, counts, state, up):
+        """EV per unit bet of taking an action and then following the
+        player's table, times the chance of no dealer blackjack"""
+        if action == STAY:
+            return self._stand(counts, _final(state), up)
+        ev = 0.0
+        for value, p, rest in _draw(counts):
+            after = _add(state, value)
+            if action == DOUBLE:
+                ev += 2 * p * self._stand(rest, _final(after), up)
+            elif after[0] > 21:
+                ev += p * self._stand(rest, BUST, up)
+            else:
+                ev += p * self._play(rest, after, up)
+        return ev
+
+    def _play_hand(self, counts, state, up):
+        soft, total, kind = _cell(state)
+        action = self._player_cells[soft, total, kind, up]
+        return self._act(action, counts, state, up)
+
+    def dealer_probabilities(self, counts, up):
+        """Probability of each dealer final (BUST, a total or BLACKJACK) for
+        an upcard once the dealer has checked for blackjack
+        :param counts: shoe composition (see shoe())
+        :param up:     dealer's upcard value (11 for an ace)
+        :return: dict of settlement index to probability
+        """
+        counts = tuple(counts)
+        counts = counts[:up - 2] + (counts[up - 2] - 1,) + counts[up - 1:]
+        dist = self._peeked(counts, up) / self._no_blackjack(counts, up)
+        return {int(final): float(dist[final]) for final in np.flatnonzero(dist)}
+
+    def decision_evs(self, counts, cards, up):
+        """EV per unit bet of each action for a player's hand (after the
+        dealer has checked for blackjack), playing the player's table for
+        any later decisions
+        :param counts: shoe composition before cards and up were dealt
+        :param cards:  player's card values
+        :param up:     dealer's upcard value (11 for an ace)
+        :return: dict of 'stay', 'hit' and 'double' to EV
+        """
+        counts = list(counts)
+        for value in list(cards) + [up]:
+            counts[value - 2] -= 1
+        state = _start(cards[0], cards[1])
+        for value in cards[2:]:
+            state = _add(state, value)
+        counts = tuple(counts)
+        norm = self._no_blackjack(counts, up)
+        return {name: float(self._act(action, counts, state, up)) / norm
+                for name, action in (('stay', STAY), ('hit', HIT),
+                                     ('double', DOUBLE))}
+
+    def hand_ev(self, counts):
+        """EV per unit bet of one hand dealt from a shoe composition
+        (dealing order as in simulate(): player, upcard, player, hole).
+        This visits every initial deal, so it takes longer than
+        decision_evs; later calls reuse the caches.
+        """
+        ev = 0.0
+        for p1, q1, after1 in _draw(tuple(counts)):
+            for up, q2, after2 in _draw(after1):
+                for p2, q3, after3 in _draw(after2):
+                    player = _start(p1, p2)
+                    lose = 0 if _final(player) == BLACKJACK else -1
+                    blackjack = 1 - self._no_blackjack(after3, up)
+                    ev += q1 * q2 * q3 * (blackjack * lose +
+                                          self._play(after3, player, up))
+        return float(ev)
+
+    def expected_winnings(self, counts):
+        """Expected money won on one hand: hand_ev times the player's bet
+        at the count"""
+        return self.bet * self.hand_ev(counts)
@@ -0,0 +1,141 @@
+"""HandRecorder, Yue Yu, cpsc 5910, R18, Seattle University
+
+HandRecorder - buffered, memory-mappable log of every hand simulate() plays
+               and every shoe it shuffles
+"""
+import os
+import numpy as np
+
+# most cards a hand can hold in a shoe of any size (every card counts at
+# least 1, so 21 cards reach 21 and the 22nd busts) and the filler for
+# unused places
+MAX_CARDS = 22
+NONE = 255
+
+HAND = np.dtype([('trial', '<u4'),       # evening number (per recorder)
+                 ('hand', '<u4'),        # hand number within the evening
+                 ('shoe', '<u4'),        # row of the shoe in the shoes file
+                 ('bet', '<i4'),         # bet before any double
+                 ('player', 'u1', MAX_CARDS),     # card numbers (NONE after)
+                 ('dealer', 'u1', MAX_CARDS),
+                 ('decisions', 'u1', MAX_CARDS),  # STAY, HIT or DOUBLE
+                 ('count', '<i2'),       # player's count when deciding
+                 ('true_count', '<f4'),  # shoe's hi-lo true count then
+                 ('outcome', '<i4')])    # money won or lost
+
+
+class HandRecorder(object):
+    """Records hands into preallocated arrays, one per HAND field, and
+    appends them to filename as HAND records in one write whenever they
+    fill; the card order of every shoe goes to filename + '.shoes' as rows
+    of card numbers. Both files are raw arrays, so load() and shoes() map
+    them back without reading them.
+
+    Object Data:
+        filename - file of HAND records
+        columns, n - preallocated array of each field and how many hands
+                     they hold
+        buffer - preallocated HAND records the columns are written out from
+        trial, hand, shoe - numbers given to the next record
+
+    Methods:
+        HandRecorder(filename, chunk) - append to filename, chunk hands at
+                                        a time (numbering trials and shoes
+                                        on from any already there)
+        start_trial() - called by simulate() at the start of each evening
+        record_shoe(cards) - called by simulate() after each shuffle
+        record(bet, player, dealer, decisions, count, true_count, outcome)
+        flush(), close() - write out buffered hands
+        HandRecorder.load(filename) - memory map a file of HAND records
+        HandRecorder.shoes(filename, ndecks) - memory map recorded shoes
+    """
+
+    def __init__(self, filename, chunk=65536):
+        self.filename = filename
+        self.columns = {name: np.full((chunk,) + HAND[name].shape, NONE, HAND[name].base)
+                        for name in HAND.names}
+        self.buffer = np.zeros(chunk, dtype=HAND)
+        self.n = 0
+        self.trial = -1
+        self.hand = 0
+        self.shoe = -1
+        if os.path.exists(filename) and os.path.getsize(filename) >= HAND.itemsize:
+            self.trial = int(HandRecorder.load(filename)['trial'][-1])
+        self._shoe_bytes = 0
+        if os.path.exists(filename + '.shoes'):
+            self._shoe_bytes = os.path.getsize(filename + '.shoes')
+        self._shoes = open(filename + '.shoes', 'ab')
+        self._hands = open(filename, 'ab')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start_trial(self):
+        self.trial += 1
+        self.hand = 0
+
+    def record_shoe(self, cards):
+        """Write a freshly shuffled shoe's card numbers
+        :raises: ValueError  if the shoes file holds shoes of another size
+        """
+        cards = np.asarray(cards, dtype=np.uint8)
+        if self._shoe_bytes % len(cards):
+            raise ValueError('%s.shoes is not a file of %d-card shoes'
+                             % (self.filename, len(cards)))
+        self._shoes.write(cards.tobytes())
+        self.shoe = self._shoe_bytes // len(cards)
+        self._shoe_bytes += len(cards)
+
+    def record(self, bet, player, dealer, decisions, count, true_count, outcome):
+        """Record one hand
+        :param player, dealer: card numbers (as dealt by a Shoe)
+        :param decisions:      player's STAY, HIT or DOUBLE decisions
+        """
+        n, columns = self.n, self.columns
+        columns['trial'][n] = self.trial
+        columns['hand'][n] = self.hand
+        columns['shoe'][n] = self.shoe
+        columns['bet'][n] = bet
+        columns['player'][n, :len(player)] = player
+        columns['dealer'][n, :len(dealer)] = dealer
+        columns['decisions'][n, :len(decisions)] = decisions
+        columns['count'][n] = count
+        columns['true_count'][n] = true_count
+        columns['outcome'][n] = outcome
+        self.hand += 1
+        self.n += 1
+        if self.n == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        """Append the buffered hands to the file"""
+        n = self.n
+        for name, column in self.columns.items():
+            self.buffer[name][:n] = column[:n]
+        for name in ('player', 'dealer', 'decisions'):
+            self.columns[name][:n] = NONE
+        self._hands.write(self.buffer[:n].tobytes())
+        self._hands.flush()
+        self._shoes.flush()
+        self.n = 0
+
+    def close(self):
+        self.flush()
+        self._hands.close()
+        self._shoes.close()
+
+    @staticmethod
+    def load(filename):
+        """Memory map a file of HAND records (read only)"""
+        return np.memmap(filename, dtype=HAND, mode='r')
+
+    @staticmethod
+    def shoes(filename, ndecks):
+        """Memory map the shoes recorded with a hands file as an array with
+        one row of card numbers per shoe (see CardDeck.ReplayDeck)"""
+        shoes = np.memmap(filename + '.shoes', dtype=np.uint8, mode='r')
+        return shoes.reshape(-1, 52 * ndecks)
+
@@ -0,0 +1,67 @@
+"""Profile, Yue Yu, cpsc 5910, R18, Seattle University
+
+Profile - opt-in wall-clock time and call counts for the phases of
+          p1.simulate()
+"""
+from time import perf_counter
+
+
+class Profile(object):
+    """Lap timer: each lap(phase) charges the time since the previous lap
+    to that phase, so instrumented code needs one call per phase boundary.
+    simulate() and visualize() take profile=None by default, and then each
+    boundary costs only an `is not None` test.
+
+    Object Data:
+        seconds - total seconds charged to each phase
+        calls - number of laps charged to each phase
+
+    Methods:
+        start() - start timing (again) from now, e.g. at the start of an
+                  evening
+        lap(phase) - charge the time since the last lap to phase
+        rate(phase) - laps of phase per second of profiled time
+        report() - hands/sec, shuffles/sec and time per phase as text
+    >>> profile = Profile()
+    >>> profile.start(); profile.lap('deal'); profile.lap('deal')
+    >>> profile.calls['deal'], profile.total() >= 0
+    (2, True)
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self._last = None
+
+    def start(self):
+        self._last = perf_counter()
+
+    def lap(self, phase):
+        now = perf_counter()
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + now - self._last
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+        self._last = now
+
+    def total(self):
+        """Seconds charged to all phases"""
+        return sum(self.seconds.values())
+
+    def rate(self, phase):
+        """Laps of a phase per second of profiled time"""
+        total = self.total()
+        return self.calls.get(phase, 0) / total if total else 0.0
+
+    def report(self):
+        """Hands/sec, shuffles/sec and a table of time per phase (simulate()
+        laps 'summary' once per hand and 'shuffle' once per shuffle)"""
+        total = self.total()
+        lines = ['hands/sec: {0:.0f}  shuffles/sec: {1:.0f}  total: {2:.3f}s'
+                 .format(self.rate('summary'), self.rate('shuffle'), total),
+                 '{0:<10}{1:>10}{2:>10}{3:>12}{4:>8}'
+                 .format('phase', 'calls', 'seconds', 'usec/call', '%')]
+        for phase in sorted(self.seconds, key=self.seconds.get, reverse=True):
+            seconds, calls = self.seconds[phase], self.calls[phase]
+            lines.append('{0:<10}{1:>10}{2:>10.3f}{3:>12.2f}{4:>8.1f}'
+                         .format(phase, calls, seconds, 1e6 * seconds / calls,
+                                 100 * seconds / total if total else 0))
+        return '\n'.join(lines)
@@ -0,0 +1,158 @@
+"""Shoe, Yue Yu, cpsc 5910, R18, Seattle University
+
+Shoe - array-backed deck (or several decks) of playing cards for fast
+       simulations, keeping card counts as it deals; CardDeck is a thin
+       facade over it.
+"""
+import random
+import numpy as np
+from Card import Card
+
+RANK_VALUES = {'2': 2, '3': 3, '4': 4, '5': 5, '6': 6, '7': 7, '8': 8,
+               '9': 9, 'T': 10, 'J': 10, 'Q': 10, 'K': 10, 'A': 11}
+
+# card i of a sorted deck is Card.ranks[i % 13] of Card.suits[i // 13]
+NAMES = [rank + suit for suit in Card.suits for rank in Card.ranks]
+# blackjack value of each card (aces are 11)
+VALUES = np.array([RANK_VALUES[name[0]] for name in NAMES], dtype=np.uint8)
+
+# tags of card counting systems, indexed by blackjack value (2 to 11)
+HI_LO = np.array([0, 0, 1, 1, 1, 1, 1, 0, 0, 0, -1, -1])
+KO = np.array([0, 0, 1, 1, 1, 1, 1, 1, 0, 0, -1, -1])
+OMEGA_II = np.array([0, 0, 1, 1, 2, 2, 2, 1, 0, -1, -2, 0])
+SYSTEMS = {'hi-lo': HI_LO, 'ko': KO, 'omega-ii': OMEGA_II}
+
+
+class Shoe(object):
+    """One or more 52-card decks stored as a uint8 array of card numbers
+
+    Object Data:
+        cards - uint8 array of card numbers (index into NAMES and VALUES)
+        top - index of last card dealt (undealt cards have index < shoe.top)
+        rng - numpy.random.Generator to shuffle with (None for numpy's
+              global random state)
+        systems - names of the counting systems being kept
+        tags - each system's tag for each card number
+        suffix - each system's sum of tags of cards[t:] for every t, so the
+                 running count of the dealt cards is suffix[:, top]
+                 (rebuilt when next asked for after deal_random() has
+                 reordered the cards)
+
+    Methods:
+        Shoe(n, rng, systems) - new shoe with 52*n cards (n defaults to 1)
+                                keeping counts for a dict of systems' tags
+                                (defaults to SYSTEMS)
+        shuffle() - replace any dealt cards and permute the whole shoe
+        arrange(order) - replace any dealt cards and put the shoe in a given
+                         order (such as a recorded shuffle)
+        deal() - take off the top card number (and return it)
+        deal_n(k) - take off the top k card numbers as a view, in the
+                    order deal() would have returned them
+        deal_random() - take an undealt card from a random spot in the shoe
+        count(), dealt(), undealt() - as for CardDeck
+        running_count(system) - sum of the system's tags of dealt cards
+        true_count(system) - running count per deck left to deal
+    Counts include every card as it leaves the shoe, so they include a
+    dealer's hole card before it is turned over.
+    >>> shoe = Shoe(2)
+    >>> shoe.deal(), shoe.deal_n(3).tolist(), shoe.undealt()
+    (51, [50, 49, 48], 100)
+    >>> VALUES[shoe.deal_n(2)].tolist()
+    [10, 9]
+    >>> shoe.running_count(), shoe.running_count('omega-ii')
+    (-5, -9)
+    >>> round(shoe.true_count(), 2)
+    -2.65
+    """
+
+    def __init__(self, num_decks=1, rng=None, systems=SYSTEMS):
+        """Starts as sorted shoe of undealt cards"""
+        self.rng = rng
+        self.cards = np.tile(np.arange(52, dtype=np.uint8), num_decks)
+        self.top = len(self.cards)
+        self.systems = {name: i for i, name in enumerate(systems)}
+        self.tags = np.array([systems[name][VALUES] for name in systems],
+                             dtype=np.int64).reshape(len(systems), 52)
+        self._recount()
+
+    def _recount(self):
+        """Rebuild the suffix sums of tags from the order of the cards"""
+        self.suffix = np.zeros((len(self.systems), len(self.cards) + 1),
+                               dtype=np.int64)
+        np.cumsum(self.tags[:, self.cards[::-1]], axis=1,
+                  out=self.suffix[:, -2::-1])
+        self._stale = False
+
+    def running_count(self, system='hi-lo'):
+        """Sum of the system's tags over every card dealt since the shuffle"""
+        if self._stale:
+            self._recount()
+        return int(self.suffix[self.systems[system], self.top])
+
+    def true_count(self, system='hi-lo'):
+        """Running count divided by the number of decks left to deal"""
+        return self.running_count(system) / (max(self.top, 1) / 52)
+
+    def deal(self):
+        """Remove and return the next card number down in the shoe.
+        None is returned if there are no more cards.
+        """
+        if self.top == 0:
+            return None
+        self.top -= 1
+        return int(self.cards[self.top])
+
+    def deal_n(self, k):
+        """Remove the next k card numbers and return them as a view into the
+        shoe (valid until the next shuffle). None is returned if fewer than
+        k cards are left.
+        """
+        if k > self.top:
+            return None
+        if k == 0:
+            return self.cards[:0]
+        self.top -= k
+        return self.cards[self.top + k - 1:self.top - 1 if self.top else None:-1]
+
+    def undealt(self):
+        """Number of cards left to deal."""
+        return self.top
+
+    def dealt(self):
+        """Number of cards already dealt."""
+        return len(self.cards) - self.top
+
+    def count(self):
+        """Total number of cards in the shoe--both dealt and undealt."""
+        return len(self.cards)
+
+    def deal_random(self):
+        """Deal a card number selected randomly from the undealt cards."""
+        if self.top == 0:
+            return None
+        if self.rng is None:
+            pick = random.randint(0, self.top - 1)
+        else:
+            pick = int(self.rng.integers(self.top))
+        # swap picked card with top card; the suffix sums between them are
+        # rebuilt when a count is next asked for
+        top = self.top = self.top - 1
+        cards = self.cards
+        card = int(cards[pick])
+        cards[pick] = cards[top]
+        cards[top] = card
+        self._stale = True
+        return card
+
+    def shuffle(self):
+        """Randomly reorder the shoe in place and reset it to be all undealt."""
+        (np.random if self.rng is None else self.rng).shuffle(self.cards)
+        self.top = len(self.cards)
+        self._recount()
+
+    def arrange(self, order):
+        """Put the shoe in the given order of card numbers (as the cards
+        array of a shuffled shoe) and reset it to be all undealt."""
+        self.cards[:] = order
+        self.top = len(self.cards)
+        self._recount()
@@ -0,0 +1,67 @@
+"""ShoeBank, Yue Yu, cpsc 5910, R18, Seattle University
+
+ShoeBank - pre-generated shuffled shoes in a memory-mapped file, dealt by
+           CardDeck.ReplayDeck so simulations share identical card sequences
+generate(filename, nshoes, ndecks, seed) - write a bank of shuffled shoes
+"""
+import numpy as np
+from CardDeck import ReplayDeck
+
+
+def generate(filename, nshoes, ndecks=6, seed=0, chunk=10000):
+    """Write nshoes independently shuffled shoes of ndecks decks to
+    filename as raw rows of uint8 card numbers (the format of a
+    HandRecorder's .shoes file), shuffling chunk shoes at a time.
+    :param seed: seed for numpy.random.default_rng (the same seed always
+                 writes the same bank)
+    """
+    rng = np.random.default_rng(seed)
+    deck = np.tile(np.arange(52, dtype=np.uint8), ndecks)
+    with open(filename, 'wb') as f:
+        for start in range(0, nshoes, chunk):
+            rows = np.broadcast_to(deck, (min(chunk, nshoes - start), len(deck)))
+            f.write(rng.permuted(rows, axis=1).tobytes())
+
+
+class ShoeBank(object):
+    """Read-only view of a file of pre-shuffled shoes
+
+    Object Data:
+        ndecks - decks per shoe
+        shoes - memory-mapped array with one row of card numbers per shoe
+
+    Methods:
+        ShoeBank(filename, ndecks) - map a file written by generate() (or a
+                                     HandRecorder's .shoes file)
+        deck(start, cycle) - CardDeck dealing the bank's shoes from a row on
+        len(bank) - number of shoes
+    >>> import os, tempfile
+    >>> filename = os.path.join(tempfile.mkdtemp(), 'bank')
+    >>> generate(filename, 3, ndecks=2, seed=1)
+    >>> bank = ShoeBank(filename, 2)
+    >>> deck = bank.deck(start=2)
+    >>> deck.shuffle()
+    >>> len(bank), deck.undealt(), sorted(deck.shoe.cards) == sorted(bank.shoes[0])
+    (3, 104, True)
+    >>> deck.deal_n(2).tolist() == bank.shoes[2][::-1][:2].tolist()
+    True
+    """
+
+    def __init__(self, filename, ndecks=6):
+        self.ndecks = ndecks
+        shoes = np.memmap(filename, dtype=np.uint8, mode='r')
+        if len(shoes) % (52 * ndecks):
+            raise ValueError('%s is not a bank of %d-deck shoes'
+                             % (filename, ndecks))
+        self.shoes = shoes.reshape(-1, 52 * ndecks)
+
+    def __len__(self):
+        return len(self.shoes)
+
+    def deck(self, start=0, cycle=True):
+        """A ReplayDeck whose every shuffle() loads the bank's next shoe
+        :param start: first shoe to deal (give each trial its own start
+                      to keep trials apart)
+        :param cycle: go back to the first shoe after the last
+        """
+        return ReplayDeck(self.shoes, start, cycle)
@@ -0,0 +1,177 @@
+"""StrategyTable, Yue Yu, cpsc 5910, R18, Seattle University
+
+StrategyTable - dense lookup table of a Blackjack strategy's decisions
+Hand - running total of a hand of cards, for looking up decisions
+card(value) - a Card with a given blackjack value
+card_value(card) - blackjack value of a Card (aces are 11)
+"""
+import numpy as np
+from Card import Card
+from Shoe import RANK_VALUES
+
+# actions in a decision table; anything simulate() doesn't recognize as
+# 'stay' or 'double' is played as a hit, so it is compiled as one here too
+STAY, HIT, DOUBLE = 0, 1, 2
+ACTIONS = {'stay': STAY, 'double': DOUBLE}
+
+# kinds of hands in a decision table
+MULTI, TWO, PAIR = 0, 1, 2
+
+# one rank for each blackjack value (aces are 11)
+VALUE_RANKS = {2: '2', 3: '3', 4: '4', 5: '5', 6: '6', 7: '7', 8: '8',
+               9: '9', 10: 'T', 11: 'A'}
+
+
+def card(value):
+    """A Card with the given blackjack value (10 is a ten, 11 an ace)"""
+    return Card(VALUE_RANKS[value] + Card.suits[0])
+
+
+def card_value(card):
+    """Blackjack value of a Card (10 for tens and faces, 11 for aces)"""
+    return RANK_VALUES[str(card)[0]]
+
+
+def representative_hands():
+    """Yield (soft, total, kind, values) with one hand of card values for
+    every cell a decision table can be asked about.
+    >>> cells = list(representative_hands())
+    >>> (0, 16, MULTI, (2, 10, 4)) in cells, (1, 12, PAIR, (11, 11)) in cells
+    (True, True)
+    """
+    seen = set()
+
+    def cell(soft, total, kind, values):
+        if (soft, total, kind) not in seen:
+            seen.add((soft, total, kind))
+            yield soft, total, kind, values
+
+    for v in range(2, 12):
+        if v == 11:
+            yield from cell(1, 12, PAIR, (v, v))
+        else:
+            yield from cell(0, 2 * v, PAIR, (v, v))
+    for a in range(2, 11):
+        for b in range(a + 1, 12):
+            if b == 11:
+                yield from cell(1, a + 11, TWO, (b, a))
+            else:
+                yield from cell(0, a + b, TWO, (a, b))
+    for total in range(6, 22):
+        b = min(10, total - 4)
+        yield from cell(0, total, MULTI, (2, b, total - 2 - b))
+    yield from cell(1, 13, MULTI, (11, 11, 11))
+    for total in range(14, 22):
+        yield from cell(1, total, MULTI, (11, 11, total - 12))
+
+
+class Hand(object):
+    """Running hard total of a hand, enough to look up its decision cell
+    >>> hand = Hand([card(11), card(6)])
+    >>> hand.cell()
+    (1, 17, 1)
+    >>> hand.add(card(10))
+    >>> hand.cell(), hand.busted()
+    ((0, 17, 0), False)
+    """
+
+    def __init__(self, cards):
+        values = [card_value(c) for c in cards]
+        self.hard = sum(1 if v == 11 else v for v in values)
+        self.ace = 11 in values
+        self.pair = len(values) == 2 and values[0] == values[1]
+        self.ncards = len(values)
+
+    def add(self, card):
+        """Add a hit card to the hand"""
+        value = card_value(card)
+        self.hard += 1 if value == 11 else value
+        self.ace = self.ace or value == 11
+        self.ncards += 1
+
+    def busted(self):
+        return self.hard > 21
+
+    def cell(self):
+        """(soft, total, kind) of the hand, counting an ace as 11 when that
+        doesn't bust it"""
+        soft = self.ace and self.hard <= 11
+        if self.ncards > 2:
+            kind = MULTI
+        else:
+            kind = PAIR if self.pair else TWO
+        return int(soft), self.hard + 10 if soft else self.hard, kind
+
+
+class StrategyTable(object):
+    """A strategy's decisions as an int8 array of STAY, HIT or DOUBLE
+
+    Object Data:
+        table - array indexed by [count bucket, soft, total, kind, upcard
+                value] (kind is MULTI, TWO or PAIR; aces are upcard 11)
+        counts - the strategy's count for each bucket (counts outside the
+                 range use the nearest bucket)
+
+    Methods:
+        StrategyTable.compile(strategy, counts) - ask a strategy's choose
+                                                  method about every cell
+        StrategyTable.load(filename) - read a table written by save()
+        save(filename) - write the table and its counts to a .npz file
+        choose(hand, up, count) - decision for a Hand against an upcard
+        lookup(soft, total, kind, up, count) - decisions for arrays of cells
+    """
+
+    def __init__(self, table, counts=(0,)):
+        self.table = np.asarray(table, dtype=np.int8)
+        self.counts = np.asarray(counts, dtype=np.int64)
+
+    @classmethod
+    def compile(cls, strategy, counts=None):
+        """Build a table by dealing one representative hand per cell to the
+        strategy and asking it what to do against every upcard.
+        :param strategy: Blackjack object (player or dealer)
+        :param counts:   consecutive counts to set as strategy.count while
+                         asking (None for a strategy that doesn't count;
+                         a CardCounting player must not be watching a shoe)
+        """
+        buckets = [None] if counts is None else list(counts)
+        table = np.full((len(buckets), 2, 22, 3, 12), STAY, dtype=np.int8)
+        upcards = {up: card(up) for up in range(2, 12)}
+        saved = getattr(strategy, 'count', None)
+        for b, count in enumerate(buckets):
+            if count is not None:
+                strategy.count = count
+            for soft, total, kind, values in representative_hands():
+                strategy.dealt([card(v) for v in values])
+                for up, up_card in upcards.items():
+                    choice = strategy.choose(up_card)
+                    table[b, soft, total, kind, up] = ACTIONS.get(choice, HIT)
+        if counts is not None:
+            strategy.count = saved
+        return cls(table, (0,) if counts is None else buckets)
+
+    @classmethod
+    def load(cls, filename):
+        """Read a table written by save()"""
+        with np.load(filename) as saved:
+            return cls(saved['table'], saved['counts'])
+
+    def save(self, filename):
+        """Write the table and its count buckets to a .npz file"""
+        np.savez(filename, table=self.table, counts=self.counts)
+
+    def bucket(self, count=0):
+        """Index of the count bucket for a count (or array of counts)"""
+        return np.clip(np.rint(count).astype(np.int64) - self.counts[0],
+                       0, len(self.counts) - 1)
+
+    def choose(self, hand, up, count=0):
+        """Decision (STAY, HIT or DOUBLE) for a Hand against an upcard value"""
+        soft, total, kind = hand.cell()
+        bucket = min(max(round(count) - int(self.counts[0]), 0),
+                     len(self.counts) - 1)
+        return self.table[bucket, soft, total, kind, up]
+
+    def lookup(self, soft, total, kind, up, count=0):
+        """Decisions for arrays of cells, as for choose()"""
+        return self.table[self.bucket(count), soft, total, kind, up]
@@ -0,0 +1,111 @@
+"""Sweep, Yue Yu, cpsc 5910, R18, Seattle University
+
+sweep(player, grid, ramps) - simulate every combination of shoe settings
+                             and bet ramps on a process pool, writing a
+                             resumable results table
+run_cell(player, dealer, cell, seeds) - simulate one combination
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import copy
+import csv
+import itertools
+import os
+import numpy as np
+from Blackjack import Soft17
+from p1 import simulate_trials
+
+PARAMETERS = ('hands', 'ndecks', 'penetration', 'nplayers')
+DEFAULTS = {'hands': 100, 'ndecks': 6, 'penetration': 0.7, 'nplayers': 7}
+COLUMNS = ('ramp',) + PARAMETERS + ('trials', 'mean', 'std', 'risk_of_ruin')
+
+
+def cell_key(cell):
+    """Identify a cell by its ramp name and parameters as they read back
+    from the results file"""
+    return (str(cell['ramp']),) + tuple(str(cell[name]) for name in PARAMETERS)
+
+
+def run_cell(player, dealer, cell, seeds, ramp=None, bankroll=10000):
+    """simulate one cell of a sweep (runs in a worker)
+    :param cell:     dict of the ramp name and each of PARAMETERS
+    :param seeds:    numpy.random.SeedSequence for each trial
+    :param ramp:     bets to give the player as its ramp (None to keep its own)
+    :param bankroll: risk of ruin is the fraction of evenings whose lowest
+                     point reached -bankroll
+    :return: row of the results table as a dict of COLUMNS
+    """
+    if ramp is not None:
+        player = copy.deepcopy(player)
+        player.ramp = tuple(ramp)
+    results = np.array(simulate_trials(player, dealer, seeds, cell['hands'], cell['ndecks'],
+                                       cell['penetration'], cell['nplayers']))
+    row = dict(cell)
+    row['trials'] = len(seeds)
+    row['mean'] = float(results[:, 0].mean())
+    row['std'] = float(results[:, 0].std())
+    row['risk_of_ruin'] = float(np.mean(results[:, 1] <= -bankroll))
+    return row
+
+
+def sweep(player,
+          grid,
+          ramps=None,
+          filename='sweep.csv',
+          dealer=Soft17(),
+          trials=1000,
+          seed=0,
+          workers=None,
+          bankroll=10000):
+    """simulate every combination of grid values and ramps, one cell per
+    task on a pool of worker processes, appending each finished cell to a
+    CSV results table. Cells already in the table are skipped, so an
+    interrupted sweep picks up where it left off when rerun.
+
+    Every cell uses the same per-trial seeds, so cells with the same ndecks
+    play the same sequence of shuffled shoes and differences between them
+    come from the settings rather than the cards.
+    :param player:   Blackjack object (copied for every cell)
+    :param grid:     dict of some of PARAMETERS to lists of values (the
+                     rest take simulate()'s defaults)
+    :param ramps:    dict of names to bet ramps for the player's ramp
+                     attribute (None to sweep only the player's own bets)
+    :param filename: results table to append to (and resume from)
+    :param seed:     master seed; keep it when resuming
+    :param workers:  number of processes (None for one per core, 1 to run
+                     in this process)
+    :return: list of the table's rows (dicts of COLUMNS; values read back
+             from an earlier run are strings)
+    """
+    ramps = {'own': None} if ramps is None else ramps
+    values = [grid.get(name, [DEFAULTS[name]]) for name in PARAMETERS]
+    cells = [dict(zip(('ramp',) + PARAMETERS, (name,) + combination))
+             for name in ramps for combination in itertools.product(*values)]
+    rows = []
+    if os.path.exists(filename):
+        with open(filename, newline='') as csv_file:
+            rows = list(csv.DictReader(csv_file))
+    done = {cell_key(row) for row in rows}
+    todo = [cell for cell in cells if cell_key(cell) not in done]
+    seeds = np.random.SeedSequence(seed).spawn(trials)
+
+    new_file = not os.path.exists(filename) or os.path.getsize(filename) == 0
+    with open(filename, 'a', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, COLUMNS)
+        if new_file:
+            writer.writeheader()
+
+        def finished(row):
+            writer.writerow(row)
+            csv_file.flush()
+            rows.append(row)
+
+        if workers == 1:
+            for cell in todo:
+                finished(run_cell(player, dealer, cell, seeds, ramps[cell['ramp']], bankroll))
+        else:
+            with ProcessPoolExecutor(workers) as pool:
+                futures = [pool.submit(run_cell, player, dealer, cell, seeds, ramps[cell['ramp']], bankroll)
+                           for cell in todo]
+                for future in as_completed(futures):
+                    finished(future.result())
+    return rows
@@ -0,0 +1,153 @@
+"""TrialStats, Yue Yu, cpsc 5910, R18, Seattle University
+
+TrialStats - constant-memory statistics of simulate() results, mergeable
+             across workers
+"""
+import numpy as np
+
+
+class TrialStats(object):
+    """Running statistics of (final, lo, hi) trial results
+
+    Object Data:
+        n - number of trials added
+        mean, m2 - Welford running mean and sum of squared deviations of final
+        edges - fixed histogram bin edges for final
+        counts - trials per bin (the first and last bins also hold anything
+                 below or above the edges)
+        worst, best - lowest lo and highest hi seen (worst drawdown and best
+                      peak of any evening)
+        min_final, max_final - extremes of final
+        lo_total, hi_total - sums of lo and hi (for their means)
+
+    Methods:
+        TrialStats(low, high, width) - empty statistics with bins of width
+                                       dollars from low to high
+        add(final, lo, hi) - add one trial
+        add_many(finals, los, his) - add arrays of trials
+        merge(other) - add another TrialStats' trials (same edges)
+        std(), variance() - population standard deviation and variance
+        quantile(q) - estimated q-quantile of final from the histogram
+        histogram(bins) - counts and edges regrouped into about bins bins
+    >>> stats = TrialStats(-1000, 1000, 10)
+    >>> stats.add(-100, -300, 50); stats.add(300, -50, 300)
+    >>> other = TrialStats(-1000, 1000, 10)
+    >>> other.add_many(np.array([0, 100]), np.array([-20, 0]), np.array([0, 200]))
+    >>> stats.merge(other)
+    >>> stats.n, stats.mean, stats.std(), stats.worst, stats.best
+    (4, 75.0, 147.9019945774904, -300, 300)
+    >>> stats.quantile(0.5)
+    10.0
+    """
+
+    def __init__(self, low=-100000, high=100000, width=50):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.edges = np.arange(low, high + width, width, dtype=float)
+        self.counts = np.zeros(len(self.edges) - 1, dtype=np.int64)
+        self.worst = None
+        self.best = None
+        self.min_final = None
+        self.max_final = None
+        self.lo_total = 0
+        self.hi_total = 0
+
+    def _bin(self, finals):
+        return np.clip(np.searchsorted(self.edges, finals, side='right') - 1,
+                       0, len(self.counts) - 1)
+
+    def add(self, final, lo, hi):
+        """Add the results of one trial"""
+        self.n += 1
+        delta = final - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (final - self.mean)
+        self.counts[self._bin(final)] += 1
+        self.worst = lo if self.worst is None else min(self.worst, lo)
+        self.best = hi if self.best is None else max(self.best, hi)
+        if self.min_final is None:
+            self.min_final = self.max_final = final
+        else:
+            self.min_final = min(self.min_final, final)
+            self.max_final = max(self.max_final, final)
+        self.lo_total += lo
+        self.hi_total += hi
+
+    def add_many(self, finals, los, his):
+        """Add the results of many trials given as arrays"""
+        if len(finals) == 0:
+            return
+        other = TrialStats.__new__(TrialStats)
+        other.edges = self.edges
+        other.n = len(finals)
+        other.mean = float(np.mean(finals))
+        other.m2 = float(np.sum((finals - other.mean) ** 2))
+        other.counts = np.bincount(self._bin(finals),
+                                   minlength=len(self.counts))
+        other.worst, other.best = int(np.min(los)), int(np.max(his))
+        other.min_final, other.max_final = int(np.min(finals)), int(np.max(finals))
+        other.lo_total, other.hi_total = int(np.sum(los)), int(np.sum(his))
+        self.merge(other)
+
+    def merge(self, other):
+        """Add the trials summarized by another TrialStats with the same edges
+        (Chan et al.'s parallel update of mean and variance)"""
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError('cannot merge TrialStats with different edges')
+        if other.n == 0:
+            return
+        if self.n == 0:
+            self.worst, self.best = other.worst, other.best
+            self.min_final, self.max_final = other.min_final, other.max_final
+        else:
+            self.worst = min(self.worst, other.worst)
+            self.best = max(self.best, other.best)
+            self.min_final = min(self.min_final, other.min_final)
+            self.max_final = max(self.max_final, other.max_final)
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+        self.counts += other.counts
+        self.lo_total += other.lo_total
+        self.hi_total += other.hi_total
+
+    def variance(self):
+        """Population variance of final (as numpy.var)"""
+        return self.m2 / self.n if self.n else float('nan')
+
+    def std(self):
+        """Population standard deviation of final (as numpy.std)"""
+        return self.variance() ** 0.5
+
+    def quantile(self, q):
+        """Estimate the q-quantile of final by interpolating within the
+        histogram bin that holds it (exact to within one bin width)"""
+        if self.n == 0:
+            return float('nan')
+        cumulative = np.cumsum(self.counts)
+        rank = q * self.n
+        i = min(int(np.searchsorted(cumulative, rank, side='left')),
+                len(self.counts) - 1)
+        before = cumulative[i] - self.counts[i]
+        fraction = (rank - before) / self.counts[i] if self.counts[i] else 0
+        value = self.edges[i] + fraction * (self.edges[i + 1] - self.edges[i])
+        return float(min(max(value, self.min_final), self.max_final))
+
+    def histogram(self, bins=20):
+        """Counts and edges of the occupied part of the histogram, regrouped
+        into about bins equal-width bins (for plotting)
+        :return: (counts, edges) as for numpy.histogram
+        """
+        occupied = np.flatnonzero(self.counts)
+        if len(occupied) == 0:
+            return np.zeros(0, dtype=np.int64), self.edges[:1]
+        first, last = occupied[0], occupied[-1] + 1
+        group = max(1, -(-(last - first) // bins))
+        starts = np.arange(first, last, group)
+        counts = np.add.reduceat(self.counts[first:last], starts - first)
+        edges = self.edges[np.append(starts, min(starts[-1] + group,
+                                                 len(self.edges) - 1))]
+        return counts, edges
@@ -0,0 +1,151 @@
+"""Bench, Yue Yu, cpsc 5910, R18, Seattle University
+
+Times the BlackJack simulator's hot spots and compares them to a baseline:
+    python bench.py --save baseline.json        (record a baseline)
+    python bench.py --baseline baseline.json    (flag regressions)
+
+run(quick) - time every benchmark, returning name -> seconds per operation
+compare(results, baseline, threshold) - benchmarks slower than the baseline
+save(results, filename), load(filename) - results as JSON
+"""
+import argparse
+import json
+import platform
+import time
+import numpy as np
+from Blackjack import Basic, Soft17
+from CardDeck import CardDeck
+from p1 import simulate, compile_tables, trial_stats, CardCounting
+
+NDECKS = (1, 6, 8)
+TRIALS = (10, 100)
+
+
+def best_time(function, repeat=5, setup=None):
+    """Fastest of repeat calls of function, in seconds per operation
+    :param function: callable returning how many operations it did
+    :param setup:    callable run before each call, outside the timing
+    """
+    best = float('inf')
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        ops = function()
+        best = min(best, (time.perf_counter() - start) / ops)
+    return best
+
+
+def construct(ndecks, n=200):
+    for i in range(n):
+        CardDeck(ndecks)
+    return n
+
+
+def shuffle(deck, n=200):
+    for i in range(n):
+        deck.shuffle()
+    return n
+
+
+def deal(deck):
+    """deal every card of a shuffled shoe (time per card)"""
+    while deck.deal() is not None:
+        pass
+    return deck.count()
+
+
+def deal_random(deck):
+    """deal_random every card of a shuffled shoe (time per card)"""
+    while deck.deal_random() is not None:
+        pass
+    return deck.count()
+
+
+def hands(player, ndecks, tables, n=1000):
+    """simulate() an evening of n hands (time per hand)"""
+    simulate(player, Soft17(), n, ndecks, rng=np.random.default_rng(0), tables=tables)
+    return n
+
+
+def trials(player, ndecks, n):
+    """visualize()'s trial loop, without plotting (time per trial)"""
+    np.random.seed(0)
+    trial_stats(n, player, ndecks=ndecks)
+    return n
+
+
+def run(quick=False):
+    """Time every benchmark
+    :param quick: one repeat of each, for checking the suite itself
+    :return: dict of benchmark name to best seconds per operation
+    """
+    repeat = 1 if quick else 5
+    results = {}
+    for ndecks in NDECKS:
+        deck = CardDeck(ndecks, np.random.default_rng(0))
+        results['construct/%d' % ndecks] = best_time(lambda: construct(ndecks), repeat)
+        results['shuffle/%d' % ndecks] = best_time(lambda: shuffle(deck), repeat)
+        results['deal/%d' % ndecks] = best_time(lambda: deal(deck), repeat, deck.shuffle)
+        results['deal_random/%d' % ndecks] = best_time(lambda: deal_random(deck), repeat,
+                                                       deck.shuffle)
+        for player in (Basic(), CardCounting()):
+            tables = compile_tables(player, Soft17())
+            name = 'simulate/%s/%d' % (type(player).__name__, ndecks)
+            results[name] = best_time(lambda: hands(player, ndecks, tables), repeat)
+    for ndecks in NDECKS:
+        for n in TRIALS:
+            for player in (Basic(), CardCounting()):
+                name = 'trials/%s/%d/%d' % (type(player).__name__, ndecks, n)
+                results[name] = best_time(lambda: trials(player, ndecks, n),
+                                          1 if n > 10 else repeat)
+    return results
+
+
+def compare(results, baseline, threshold=0.10):
+    """Benchmarks more than threshold (a fraction) slower than a baseline
+    :return: list of (name, baseline seconds, seconds, ratio), worst first
+    """
+    slower = [(name, baseline[name], seconds, seconds / baseline[name])
+              for name, seconds in results.items()
+              if name in baseline and seconds > baseline[name] * (1 + threshold)]
+    return sorted(slower, key=lambda row: row[3], reverse=True)
+
+
+def save(results, filename):
+    with open(filename, 'w') as f:
+        json.dump({'python': platform.python_version(),
+                   'machine': platform.machine(),
+                   'results': results}, f, indent=2, sort_keys=True)
+
+
+def load(filename):
+    with open(filename) as f:
+        return json.load(f)['results']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the BlackJack simulator')
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='JSON file from --save to compare to')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='fraction slower than the baseline to flag (default 0.10)')
+    parser.add_argument('--quick', action='store_true', help='one repeat of each benchmark')
+    args = parser.parse_args()
+
+    results = run(args.quick)
+    baseline = load(args.baseline) if args.baseline else {}
+    for name, seconds in results.items():
+        change = ''
+        if name in baseline:
+            change = '{0:+.1%}'.format(seconds / baseline[name] - 1)
+        print('{0:<28}{1:>14.2f} usec {2:>8}'.format(name, 1e6 * seconds, change))
+    if args.save:
+        save(results, args.save)
+    if args.baseline:
+        slower = compare(results, baseline, args.threshold)
+        for name, before, after, ratio in slower:
+            print('REGRESSION {0}: {1:.2f} -> {2:.2f} usec ({3:.2f}x)'.format(
+                name, 1e6 * before, 1e6 * after, ratio))
+        if slower:
+            raise SystemExit(1)
@@ -2,13 +2,32 @@
  
 visualize(player) - simulate and plot results of a blackjack strategy
 simulate(player) - simulate playing an evening's worth of blackjack
+                   (see BatchSim.simulate_batch for many evenings at once,
+                   HandRecorder to log its hands and shoes)
+simulate_parallel(trials, player) - simulate() many evenings on a process
+                                    pool, reproducibly from one seed
+simulate_until(tolerance, player) - simulate() until the mean winnings
+                                    are known to a given standard error
+compare_paired(trials, players) - compare strategies on the same shoes
+compile_tables(player, dealer) - decision tables simulate() plays by
+trial_stats(trials, player) - visualize()'s trials without the plot
 overlay_bell_curve(mu, sigma, n, bins) - plot a normal curve atop an 
                                     histogram in current pylab figure
 """
 
 from Blackjack import Blackjack, Soft17, Basic
-from CardDeck import CardDeck
+from CardDeck import CardDeck, CARDS
 from Card import Card
+from BatchSim import simulate_batch
+from StrategyTable import StrategyTable, Hand, card_value, STAY, DOUBLE
+from TrialStats import TrialStats
+from Profile import Profile
+from Shoe import HI_LO
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import copy
+import os
+import time
 import numpy as np
 import pylab
 from math import pi, sqrt, e
@@ -18,7 +37,12 @@ def simulate(player,
              hands=100,
              ndecks=6,
              penetration=0.7,
-             nplayers=7):
+             nplayers=7,
+             rng=None,
+             tables=None,
+             recorder=None,
+             deck=None,
+             profile=None):
     """simulate playing an evening's worth of blackjack
     :param player:           Blackjack object representing the player
     :param dealer:           Blackjack object representing the dealer
@@ -26,6 +50,18 @@ def simulate(player,
     :param ndecks:           Number of decks in each shoe
     :param penetration:      Depth of shoe before reshuffling
     :param nplayers:         Number of other players present (not simulated, but cards seen)
+    :param rng:              numpy.random.Generator for shuffling (None for
+                             the global random module)
+    :param tables:           (player, dealer) StrategyTable objects to play
+                             by (see compile_tables, which gives the ones
+                             for the strategies' classes if None)
+    :param recorder:         HandRecorder to log every hand and shoe to
+                             (None to record nothing)
+    :param deck:             CardDeck to deal from, such as a ReplayDeck of
+                             recorded shoes (None for a new
+                             CardDeck(ndecks, rng))
+    :param profile:          Profile to charge each phase's time to (None
+                             to not time anything)
     :return: (final, lo, hi) player's accumulated winnings
     """
 
@@ -39,56 +75,105 @@ def simulate(player,
 
         # bet
         money = player.bet()
+        bet = money
+        decisions = []
+        if recorder is not None:
+            start = cardDeck.top
 
         # first round
-        for i in range(nplayers):
-            otherPlayerCards.append(cardDeck.deal())
+        otherPlayerCards.append(cardDeck.deal_n(nplayers))
         playerCards.append(cardDeck.deal())
         dlr_up = cardDeck.deal()
         dealerCards.append(dlr_up)
         # second round
-        for i in range(nplayers):
-            otherPlayerCards.append(cardDeck.deal())
+        otherPlayerCards.append(cardDeck.deal_n(nplayers))
         playerCards.append(cardDeck.deal())
+        # a shoe counts cards as they leave it, so the count the player
+        # plays at is read before the dealer's hole card is dealt
+        count = getattr(player, 'count', 0)
+        if recorder is not None:
+            trueCount = cardDeck.shoe.true_count()
         dealerCards.append(cardDeck.deal())
 
         player.dealt(playerCards)
         dealer.dealt(dealerCards)
+        if profile is not None:
+            profile.lap('deal')
+        playerHits = []
+        dealerHits = []
+
+        def reveal(money):
+            """show the player everyone else's cards and return money"""
+            if profile is not None:
+                profile.lap('settle')
+            others = [CARDS[i] for dealt in otherPlayerCards for i in dealt]
+            player.sees(others + dealerCards + dealerHits)
+            if profile is not None:
+                profile.lap('sees')
+            if recorder is not None:
+                # the hand's card numbers in the order dealt: others,
+                # player, upcard, others, player, hole, then the player's
+                # hits and the dealer's
+                dealt = cardDeck.shoe.cards[cardDeck.top:start].tolist()[::-1]
+                n = 2 * nplayers + 4
+                hits = n + len(playerHits)
+                recorder.record(bet, [dealt[nplayers], dealt[n - 2]] + dealt[n:hits],
+                                [dealt[nplayers + 1], dealt[n - 1]] + dealt[hits:],
+                                decisions, count, trueCount,
+                                money)
+                if profile is not None:
+                    profile.lap('record')
+            return money
         
         # dealer has blackjack
         if(dealer.has_bj()):
             if(player.has_bj()):
-                return 0
+                return reveal(0)
             else:
-                return -1 * money
+                return reveal(-1 * money)
         
         # player
-        choice = player.choose(dlr_up)
+        up = card_value(dlr_up)
+        hand = Hand(playerCards)
+        choice = playerTable.choose(hand, up, count)
+        decisions.append(choice)
         isDouble = False
-        while(choice != 'stay'):
-            if(choice == 'double'):
+        while(choice != STAY):
+            if(choice == DOUBLE):
                 isDouble = True
                 money = money * 2
-            player.hit(cardDeck.deal())
-            if(player.busted() or isDouble):
+            card = cardDeck.deal()
+            player.hit(card)
+            playerHits.append(card)
+            hand.add(card)
+            if(hand.busted() or isDouble):
                 break
-            choice = player.choose(dlr_up)
+            choice = playerTable.choose(hand, up, count)
+            decisions.append(choice)
+        if profile is not None:
+            profile.lap('choose')
 
         # dealer
-        choice = dealer.choose(dlr_up)
-        while(choice != 'stay'):
-            dealer.hit(cardDeck.deal())
-            if(dealer.busted()):
+        hand = Hand(dealerCards)
+        choice = dealerTable.choose(hand, up)
+        while(choice != STAY):
+            card = cardDeck.deal()
+            dealer.hit(card)
+            dealerHits.append(card)
+            hand.add(card)
+            if(hand.busted()):
                 break
-            choice = dealer.choose(dlr_up)
+            choice = dealerTable.choose(hand, up)
+        if profile is not None:
+            profile.lap('dealer')
 
         # compare
         if(player.beats(dealer)):
-            return money
+            return reveal(money)
         elif(dealer.beats(player)):
-            return -1*money
+            return reveal(-1*money)
         else:
-            return 0
+            return reveal(0)
 
     def summary(final, lo, hi, current):
         final += current
@@ -96,8 +181,22 @@ def simulate(player,
         hi = final if final > hi else hi
         return (final, lo, hi)
 
-    cardDeck = CardDeck(ndecks)
+    if profile is not None:
+        profile.start()
+    if tables is None:
+        tables = compile_tables(player, dealer)
+    (playerTable, dealerTable) = tables
+    cardDeck = CardDeck(ndecks, rng) if deck is None else deck
+    if profile is not None:
+        profile.lap('setup')
     cardDeck.shuffle()
+    if profile is not None:
+        profile.lap('shuffle')
+    if recorder is not None:
+        recorder.start_trial()
+        recorder.record_shoe(cardDeck.shoe.cards)
+    if hasattr(player, 'watch'):
+        player.watch(cardDeck.shoe)
     totalCount = cardDeck.count()
 
     final = 0
@@ -107,17 +206,261 @@ def simulate(player,
     for i in range(hands):
         money = simulateOneHand(player, dealer, nplayers)
         (final, lo, hi) = summary(final, lo, hi, money)
+        if profile is not None:
+            profile.lap('summary')
         if cardDeck.undealt()< penetration*totalCount:
             cardDeck.shuffle()
+            if recorder is not None:
+                recorder.record_shoe(cardDeck.shoe.cards)
             player.new_shoe()
             dealer.new_shoe()
+            if profile is not None:
+                profile.lap('shuffle')
 
     return (final, lo, hi)
 
-def visualize(trials, player=Basic()):
+# compiled (player, dealer) tables by the strategies' classes
+_TABLES = {}
+
+def compile_tables(player, dealer):
+    """(player, dealer) StrategyTable objects for simulate() to play by,
+    compiled once per pair of strategy classes (a strategy's decisions
+    depend only on its class and the hand, as for every strategy here;
+    pass simulate() tables= for one configured per instance)"""
+    key = (type(player), type(dealer))
+    if key not in _TABLES:
+        _TABLES[key] = (StrategyTable.compile(player), StrategyTable.compile(dealer))
+    return _TABLES[key]
+
+def simulate_trials(player, dealer, seeds, hands, ndecks, penetration, nplayers, accumulate=False):
+    """simulate one evening for each seed, each with a fresh copy of the
+    player and dealer and its own shuffling stream (runs in a worker)
+    :param seeds:      numpy.random.SeedSequence for each trial
+    :param accumulate: if True, return a TrialStats instead of a list
+    :return: list of (final, lo, hi) in the order of seeds (or TrialStats)
+    """
+    tables = compile_tables(player, dealer)
+    results = TrialStats() if accumulate else []
+    for seed in seeds:
+        result = simulate(copy.deepcopy(player), copy.deepcopy(dealer),
+                          hands, ndecks, penetration, nplayers,
+                          np.random.default_rng(seed), tables)
+        if accumulate:
+            results.add(*result)
+        else:
+            results.append(result)
+    return results
+
+def map_trials(function, seeds, workers=None, pool=None):
+    """Call function on contiguous chunks of seeds over a pool of worker
+    processes (chunking doesn't change any trial's seed, so results don't
+    depend on the number of workers)
+    :param function: picklable callable taking a list of seeds, such as a
+                     functools.partial of simulate_trials
+    :param workers:  number of processes (None for one per core, 1 to run
+                     in this process)
+    :param pool:     ProcessPoolExecutor with that many workers to reuse
+                     (one is started and shut down here if None)
+    :return: list of function's results, one per chunk in seed order
+    """
+    if workers == 1:
+        return [function(seeds)]
+    workers = workers or os.cpu_count()
+    if pool is None:
+        with ProcessPoolExecutor(workers) as pool:
+            return map_trials(function, seeds, workers, pool)
+    nchunks = max(1, min(len(seeds), 4 * workers))
+    bounds = np.linspace(0, len(seeds), nchunks + 1).astype(int)
+    futures = [pool.submit(function, seeds[a:b])
+               for a, b in zip(bounds[:-1], bounds[1:])]
+    return [future.result() for future in futures]
+
+def simulate_parallel(trials,
+                      player=Basic(),
+                      dealer=Soft17(),
+                      hands=100,
+                      ndecks=6,
+                      penetration=0.7,
+                      nplayers=7,
+                      seed=None,
+                      workers=None,
+                      accumulate=False):
+    """simulate() many evenings spread over a pool of worker processes
+    Trial i always shuffles with the i-th stream spawned from seed, so the
+    results for a given seed are the same for any number of workers.
+    :param trials:   number of evenings to simulate
+    :param seed:     master seed (None for fresh entropy)
+    :param workers:  number of processes (None for one per core, 1 to run
+                     in this process)
+    :param accumulate: if True, each worker summarizes its trials in a
+                     TrialStats and the merged TrialStats is returned
+    :return: list of (final, lo, hi), one per trial in trial order (or
+                     TrialStats)
+    """
+    seeds = np.random.SeedSequence(seed).spawn(trials)
+    function = partial(simulate_trials, player, dealer, hands=hands, ndecks=ndecks, penetration=penetration,
+                       nplayers=nplayers, accumulate=accumulate)
+    chunks = map_trials(function, seeds, workers)
+    if accumulate:
+        results = TrialStats()
+        for chunk in chunks:
+            results.merge(chunk)
+        return results
+    return [result for chunk in chunks for result in chunk]
+
+def simulate_until(tolerance,
+                   player=Basic(),
+                   dealer=Soft17(),
+                   hands=100,
+                   ndecks=6,
+                   penetration=0.7,
+                   nplayers=7,
+                   seed=None,
+                   workers=1,
+                   batch=100,
+                   max_seconds=None,
+                   max_trials=None):
+    """simulate() evenings in batches until the standard error of the mean
+    final winnings is at most tolerance (or a budget runs out)
+    Each batch is sized from the variance seen so far to reach the
+    tolerance, but is never smaller than batch nor larger than the trials
+    already run. Trial i shuffles with the i-th stream spawned from seed,
+    as in simulate_parallel.
+    :param tolerance:   target standard error of the mean, in dollars
+    :param workers:     number of processes (see map_trials)
+    :param batch:       trials in the first (and smallest) batch
+    :param max_seconds: stop after the batch that uses up this much time
+    :param max_trials:  never run more than this many trials
+    :return: dict with the merged 'stats' (TrialStats), the 'trials' and
+             'hands' used, the final 'stderr' and whether it 'converged'
+    """
+    start = time.perf_counter()
+    seeds = np.random.SeedSequence(seed)
+    stats = TrialStats()
+    stderr = float('inf')
+    function = partial(simulate_trials, player, dealer, hands=hands, ndecks=ndecks, penetration=penetration,
+                       nplayers=nplayers, accumulate=True)
+    pool = None if workers == 1 else ProcessPoolExecutor(workers)
+    try:
+        while stderr > tolerance:
+            if max_seconds is not None and time.perf_counter() - start >= max_seconds:
+                break
+            size = batch
+            if stats.n > 1:
+                needed = int(np.ceil(stats.variance() * stats.n / (stats.n - 1) / tolerance ** 2))
+                size = min(max(needed - stats.n, batch), stats.n)
+            if max_trials is not None:
+                size = min(size, max_trials - stats.n)
+            if size <= 0:
+                break
+            for chunk in map_trials(function, seeds.spawn(size), workers, pool):
+                stats.merge(chunk)
+            if stats.n > 1:
+                stderr = sqrt(stats.variance() / (stats.n - 1))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return {'stats': stats,
+            'trials': stats.n,
+            'hands': stats.n * hands,
+            'stderr': stderr,
+            'converged': stderr <= tolerance}
+
+def compare_trials(players, dealer, seeds, hands, ndecks, penetration, nplayers):
+    """simulate one evening per seed for every player, all players getting
+    the same shuffles for a given seed (runs in a worker)
+    :return: array of final winnings, one row per seed and one column per
+             player
+    """
+    tables = [compile_tables(player, dealer) for player in players]
+    finals = np.zeros((len(seeds), len(players)), dtype=np.int64)
+    for i, seed in enumerate(seeds):
+        for k, player in enumerate(players):
+            (final, lo, hi) = simulate(copy.deepcopy(player), copy.deepcopy(dealer),
+                                       hands, ndecks, penetration, nplayers,
+                                       np.random.default_rng(seed), tables[k])
+            finals[i, k] = final
+    return finals
+
+def compare_paired(trials,
+                   players,
+                   dealer=Soft17(),
+                   hands=100,
+                   ndecks=6,
+                   penetration=0.7,
+                   nplayers=7,
+                   seed=None,
+                   workers=None,
+                   z=1.96):
+    """compare strategies with common random numbers: in every trial each
+    player plays an evening from the same sequence of shuffled shoes, so
+    the per-trial differences leave out most of the shoe-to-shoe noise
+    :param trials:  number of evenings to simulate
+    :param players: list of Blackjack objects; each is compared to the first
+    :param seed:    master seed (None for fresh entropy)
+    :param workers: number of processes (see map_trials)
+    :param z:       normal quantile for the confidence intervals
+    :return: dict with 'finals' (trials x players array), each player's
+             'mean' and 'std', and for each player after the first the
+             per-trial 'diff' from the first player, its 'diff_mean',
+             paired 'diff_ci' and 'variance_reduction' (how many times
+             more trials unpaired runs would need for the same interval)
+    """
+    seeds = np.random.SeedSequence(seed).spawn(trials)
+    function = partial(compare_trials, players, dealer, hands=hands, ndecks=ndecks, penetration=penetration,
+                       nplayers=nplayers)
+    finals = np.concatenate(map_trials(function, seeds, workers))
+    diff = finals[:, 1:] - finals[:, :1]
+    var = finals.var(axis=0, ddof=1)
+    diff_var = diff.var(axis=0, ddof=1)
+    half = z * np.sqrt(diff_var / trials)
+    diff_mean = diff.mean(axis=0)
+    return {'finals': finals,
+            'mean': finals.mean(axis=0),
+            'std': np.sqrt(var),
+            'diff': diff,
+            'diff_mean': diff_mean,
+            'diff_ci': [(float(a), float(b)) for a, b in zip(diff_mean - half, diff_mean + half)],
+            'variance_reduction': (var[0] + var[1:]) / diff_var}
+
+def trial_stats(trials, player, dealer=Soft17(), hands=100, ndecks=6, penetration=0.7, nplayers=6,
+                batch=False, workers=None, seed=None, profile=None):
+    """simulate evenings of blackjack as visualize() does, without plotting
+    :param batch:    if True, play all trials at once with simulate_batch
+    :param workers:  if set, run the trials with simulate_parallel on this
+                     many processes
+    :param seed:     master seed for simulate_batch or simulate_parallel
+    :param profile:  Profile to time the phases of simulate() with and
+                     print a report of (trials run in this process only)
+    :return: TrialStats of the trials
+    """
+    stats = TrialStats()
+    if batch:
+        (final, lo, hi) = simulate_batch(player, dealer, trials, hands, ndecks, penetration, nplayers, seed)
+        stats.add_many(final, lo, hi)
+    elif workers:
+        stats = simulate_parallel(trials, player, dealer, hands, ndecks, penetration, nplayers, seed, workers,
+                                  accumulate=True)
+    else:
+        tables = compile_tables(player, dealer)
+        for i in range(trials):
+            (final, lo, hi) = simulate(player, dealer, hands, ndecks, penetration, nplayers, tables=tables,
+                                       profile=profile)
+            stats.add(final, lo, hi)
+        if profile is not None:
+            print(profile.report())
+    return stats
+
+def visualize(trials, player=Basic(), batch=False, workers=None, seed=None, profile=None):
     """simulate and plot results of a blackjack strategy
     :param trials:   number of trials to simulate
     :param player:   player Blackjack object to simulate
+    :param batch:    if True, play all trials at once with simulate_batch
+    :param workers:  if set, run the trials with simulate_parallel on this
+                     many processes
+    :param seed:     master seed for simulate_batch or simulate_parallel
+    :param profile:  Profile to time the phases of simulate() with and
+                     print a report of (trials run in this process only)
     """
     dealer=Soft17()
     hands=100
@@ -127,17 +470,15 @@ def visualize(trials, player=Basic()):
     nplayers=6
 
     binsNumber = 20
-    #finalRecords={}
-    records=[]
-    for i in range(trials):
-        (final, lo, hi) = simulate(player, dealer, hands, ndecks, penetration, nplayers)
-        #finalRecords[final]=finalRecords.get(final, 0) +1
-        records.append(final)
-    mu = np.mean(records)
-    sigma = np.std(records)
-    times, winnings, patches = pylab.hist(records,binsNumber,edgecolor="None")
-
-    worstMoment = min(records)
+    stats = trial_stats(trials, player, dealer, hands, ndecks, penetration, nplayers, batch, workers, seed,
+                        profile)
+    mu = stats.mean
+    sigma = stats.std()
+    counts, edges = stats.histogram(binsNumber)
+    times, winnings, patches = pylab.hist(edges[:-1], edges, weights=counts, edgecolor="None")
+
+    # lowest point of any evening, not just the lowest final result
+    worstMoment = stats.worst
     pylab.xlim(min(mu-3.5*sigma, min(winnings)), max(mu+3.5*sigma, max(winnings)))
     ymin,ymax=pylab.ylim()
 
@@ -184,8 +525,31 @@ def overlay_bell_curve(mu, sigma, n, bins):
 
 
 class CardCounting(Basic):
-    """Hi-lo card counting ideal strategy."""
-    count = 0
+    """Hi-lo card counting ideal strategy.
+    Once watching a Shoe (simulate() has it watch the shoe being dealt) the
+    count is the shoe's running count for system, which includes every
+    card dealt; otherwise it is kept from the cards passed to sees().
+    """
+    _count = 0
+    system = 'hi-lo'
+    shoe = None
+    # bet at a count of 0 (or less), 1, 2, ... (the last for any higher)
+    ramp = (10, 50, 100, 200, 500, 1000)
+
+    @property
+    def count(self):
+        """Running count of the cards seen since the last reshuffle"""
+        if self.shoe is not None:
+            return self.shoe.running_count(self.system)
+        return self._count
+
+    @count.setter
+    def count(self, count):
+        self._count = count
+
+    def watch(self, shoe):
+        """Read the count from a Shoe instead of counting cards seen"""
+        self.shoe = shoe
 
     def title(self):
         """Descriptive heading for reports for this player"""
@@ -193,18 +557,7 @@ class CardCounting(Basic):
 
     def bet(self):
         """Gets the bet from the player prior to the hand being played"""
-        if self.count<=0:
-            return 10
-        elif self.count == 1:
-            return 50
-        elif self.count == 2:
-            return 100
-        elif self.count == 3:
-            return 200
-        elif self.count == 4:
-            return 500
-        else:
-            return 1000
+        return self.ramp[min(max(self.count, 0), len(self.ramp) - 1)]
 
     def new_shoe(self):
         """Called when the deck has been reshuffled"""
@@ -212,21 +565,28 @@ class CardCounting(Basic):
 
     def sees(self, cards):
         """Informs the player of any visible cards besides those she has been dealt"""
+        if self.shoe is not None:
+            return
         for card in cards:
-            if card.rank_value() <=6:
-                self.count += 1
-            elif card.rank_value() >= 10:
-                self.count -= 1
+            self._count += int(HI_LO[card_value(card)])
 
 if __name__ == "__main__":
     trials = 1000
+    # set BLACKJACK_PROFILE=1 to print where simulate()'s time goes
+    profiling = bool(os.environ.get('BLACKJACK_PROFILE'))
     basicPlayer=Basic()
     pylab.figure()
     pylab.subplot(2,1,1)
-    visualize(trials, basicPlayer)
+    visualize(trials, basicPlayer, profile=Profile() if profiling else None)
 
     pylab.subplot(2,1,2)
     cardCourtingPlayer=CardCounting()
-    visualize(trials, cardCourtingPlayer)
+    visualize(trials, cardCourtingPlayer, profile=Profile() if profiling else None)
     pylab.tight_layout()
+
+    paired = compare_paired(trials, [basicPlayer, cardCourtingPlayer])
+    (low, high) = paired['diff_ci'][0]
+    print('hi-lo counting minus basic strategy: ${0:.2f} per evening (95% CI ${1:.2f} to ${2:.2f}, '
+          '{3:.1f}x fewer trials than unpaired runs)'.format(paired['diff_mean'][0], low, high,
+                                                             paired['variance_reduction'][0]))
     pylab.show()   
@@ -0,0 +1,203 @@
+import weakref
+import numpy as np
+from scipy import stats
+from TimeSeries import TimeSeries, to_dates
+
+OPS = {'+': np.add, '-': np.subtract, '*': np.multiply, '/': np.divide}
+
+def lazy(series):
+    """Expression for a TimeSeries (or the Expression itself)
+    >>> from datetime import datetime
+    >>> a = TimeSeries('a', data={datetime(2018,1,i):i for i in range(10,20,3)})
+    >>> b = TimeSeries('b', data={datetime(2018,1,i):2*i for i in range(10,20)})
+    >>> e = (lazy(b) - a).returns(1) * 100
+    >>> e
+    (returns((b - a), 1) * 100)
+    >>> e.get_values(e.get_dates()).tolist() == [3/10*100, 3/13*100, 3/16*100]
+    True
+    >>> (lazy(b) - a) is (lazy(b) - a)
+    True
+    >>> a.append([datetime(2018,1,22)], [22])
+    >>> lazy(a).last_date
+    datetime.datetime(2018, 1, 22, 0, 0)
+    """
+    if isinstance(series, Expression):
+        return series
+    # a series' points change with its version, so new expressions on it
+    # see them (ones built before keep the dates they worked out)
+    return _node('series', (), (id(series), series.version), series)
+
+def _node(op, args, params, source=None):
+    """The one Expression for an operation on given arguments (identical
+    subexpressions are the same object, so they are evaluated once)"""
+    key = (op, tuple(id(arg) for arg in args), params)
+    node = Expression.interned.get(key)
+    if node is None:
+        node = Expression.__new__(Expression)
+        node.op, node.args, node.params, node.source = op, args, params, source
+        node._dates = None
+        Expression.interned[key] = node
+    return node
+
+class Expression(object):
+    """Lazy series arithmetic: + - * / between series and with scalars,
+    lag, returns and window build a graph instead of new series. Asking for
+    values evaluates the graph over just the requested dates in one
+    vectorized pass (each node's dates are worked out once, from its
+    arguments' dates alone), sharing common subexpressions.
+    Dates follow TimeSeries: series arithmetic keeps the dates both sides
+    have, and lag and returns shift by points as the lag and returns
+    classes do, with the same results.
+
+    Methods:
+        lag(n), returns(n), window(start, end) - derived expressions
+        get_dates(candidates, start, end), get_values(dates) - as TimeSeries
+        correlation(other) - Pearson correlation over their common dates
+        series(start, end) - evaluate into a TimeSeries
+    """
+    interned = weakref.WeakValueDictionary()
+
+    def _binary(self, other, op, reflected=False):
+        if isinstance(other, (Expression, TimeSeries)):
+            args = (lazy(other), self) if reflected else (self, lazy(other))
+            return _node(op, args, ())
+        return _node('scalar', (self,), (op, other, reflected))
+
+    def __add__(self, other): return self._binary(other, '+')
+    def __sub__(self, other): return self._binary(other, '-')
+    def __mul__(self, other): return self._binary(other, '*')
+    def __truediv__(self, other): return self._binary(other, '/')
+    def __radd__(self, other): return self._binary(other, '+', True)
+    def __rsub__(self, other): return self._binary(other, '-', True)
+    def __rmul__(self, other): return self._binary(other, '*', True)
+    def __rtruediv__(self, other): return self._binary(other, '/', True)
+
+    def lag(self, shift_days):
+        """values moved shift_days points later (see the lag class)"""
+        return _node('lag', (self,), (shift_days,))
+
+    def returns(self, hold_days):
+        """return of holding for hold_days points (see the returns class)"""
+        return _node('returns', (self,), (hold_days,))
+
+    def window(self, start=None, end=None):
+        """restricted to dates from start to end (either may be None)"""
+        return _node('window', (self,), (
+            None if start is None else to_dates(start).item(),
+            None if end is None else to_dates(end).item()))
+
+    def __repr__(self):
+        if self.op == 'series':
+            return self.source.name
+        if self.op in OPS:
+            return '({0!r} {1} {2!r})'.format(self.args[0], self.op, self.args[1])
+        if self.op == 'scalar':
+            op, c, reflected = self.params
+            return '({0!r} {1} {2!r})'.format(*((c, op, self.args[0]) if reflected else (self.args[0], op, c)))
+        return '{0}({1!r}, {2})'.format(self.op, self.args[0], ', '.join(map(repr, self.params)))
+
+    @property
+    def name(self):
+        return repr(self)
+
+    def dates(self):
+        """sorted datetime64 array of every date the expression has a value"""
+        if self._dates is None:
+            if self.op == 'series':
+                dates = self.source.dates
+            elif self.op in OPS:
+                dates = np.intersect1d(self.args[0].dates(), self.args[1].dates(), assume_unique=True)
+            elif self.op == 'scalar':
+                dates = self.args[0].dates()
+            elif self.op == 'window':
+                dates = self.args[0].dates()
+                start, end = self.params
+                lo = 0 if start is None else np.searchsorted(dates, to_dates(start), 'left')
+                hi = len(dates) if end is None else np.searchsorted(dates, to_dates(end), 'right')
+                dates = dates[lo:hi]
+            else:   # lag and returns
+                dates = self.args[0].dates()[self.params[0]:]
+            self._dates = dates
+        return self._dates
+
+    def evaluate(self, dates, memo=None):
+        """values on dates, which must be some of self.dates() in order
+        :param memo: values already worked out in this evaluation, by node
+                     and dates array
+        """
+        memo = {} if memo is None else memo
+        key = (id(self), id(dates))
+        if key in memo:
+            return memo[key][1]
+        if self.op == 'series':
+            values = self.source.get_values(dates)
+        elif self.op in OPS:
+            values = OPS[self.op](self.args[0].evaluate(dates, memo), self.args[1].evaluate(dates, memo))
+        elif self.op == 'scalar':
+            op, c, reflected = self.params
+            values = self.args[0].evaluate(dates, memo)
+            values = OPS[op](c, values) if reflected else OPS[op](values, c)
+        elif self.op == 'window':
+            values = self.args[0].evaluate(dates, memo)
+        else:
+            child = self.args[0]
+            shift = self.params[0]
+            before = child.dates()[np.searchsorted(child.dates(), dates) - shift]
+            if self.op == 'lag':
+                values = child.evaluate(before, memo)
+            else:
+                bought = child.evaluate(before, memo)
+                values = (child.evaluate(dates, memo) - bought) / bought
+        memo[key] = (dates, values)   # keeps dates alive so its id stays unique
+        return values
+
+    @property
+    def first_date(self):
+        dates = self.dates()
+        return dates[0].item() if len(dates) else None
+
+    @property
+    def last_date(self):
+        dates = self.dates()
+        return dates[-1].item() if len(dates) else None
+
+    def get_dates(self, candidates=None, start=None, end=None):
+        """As TimeSeries.get_dates"""
+        dates = self.dates()
+        if candidates is not None:
+            candidates = to_dates(candidates)
+            i = np.searchsorted(dates, candidates)
+            found = i < len(dates)
+            found[found] = dates[i[found]] == candidates[found]
+            return candidates[found]
+        return self.window(start, end).dates()
+
+    def get_values(self, dates):
+        """As TimeSeries.get_values, evaluating just these dates
+        :raises: KeyError  if any requested date has no value
+        """
+        dates = to_dates(dates)
+        if len(dates) > 1 and not (dates[1:] > dates[:-1]).all():
+            order = np.argsort(dates, kind='stable')
+            values = np.empty(len(dates))
+            values[order] = self.get_values(dates[order])
+            return values
+        missing = np.setdiff1d(dates, self.dates(), assume_unique=True)
+        if len(missing):
+            raise KeyError(missing[0].item())
+        return self.evaluate(dates)
+
+    def correlation(self, other):
+        """Pearson correlation coefficient with another expression or
+        TimeSeries over the dates both have, evaluating both together"""
+        other = lazy(other)
+        dates = np.intersect1d(self.dates(), other.dates(), assume_unique=True)
+        memo = {}
+        r, p = stats.pearsonr(self.evaluate(dates, memo), other.evaluate(dates, memo))
+        return r
+
+    def series(self, start=None, end=None):
+        """Evaluate the expression into a TimeSeries (over a date window)"""
+        expression = self.window(start, end)
+        dates = expression.dates()
+        return TimeSeries(repr(self), dates=dates, values=expression.evaluate(dates))
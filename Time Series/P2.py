@@ -1,4 +1,4 @@
-from TimeSeries import dgs3mo, dgs10, gold_spot
+from TimeSeries import dgs3mo, dgs10, gold_spot, Frame
 from datetime import datetime
 import matplotlib.pyplot as plt
 from scipy import stats
@@ -7,12 +7,10 @@ def recession_visual():
     short = dgs3mo()
     long = dgs10()
     gold=gold_spot()
-    dates = short.get_dates(start=datetime(1968, 4, 1))
-    dates = long.get_dates(dates)
-    dates=gold.get_dates(dates)
-    diff = long - short
-    y_diff = diff.get_values(dates)
-    y_gold=gold.get_values(dates)
+    frame = Frame([short, long, gold], start=datetime(1968, 4, 1))
+    dates = frame.dates
+    y_diff = frame.column(1) - frame.column(0)
+    y_gold = frame.column(2)
     fig = plt.figure()
     ax = fig.add_subplot(111)
     plot1=ax.plot(dates, y_gold)
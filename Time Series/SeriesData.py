@@ -0,0 +1,692 @@
+"""Series data: date/value series held as sorted arrays, read from csv
+files in one pass (and cached beside them as .npy files), shared through
+a process-wide registry and aligned into frames. Used by TimeSeries.py and
+Best Regression FSS/p3.py.
+
+Classes:
+Registry - process-wide LRU cache of loaded series (REGISTRY)
+Points - read-only dict-like view of a series' points
+TimeSeries - class to hold a date/value series of data
+Difference - a time series that is the difference between two others
+Fred - a time series that is based on a csv file downloaded from FRED
+Frame - several series aligned on one date index as one 2-D array
+"""
+
+import os
+import re
+import csv
+import json
+import hashlib
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from collections.abc import Mapping
+from datetime import datetime
+from scipy import stats
+import numpy as np
+
+DATA=os.getcwd()
+
+DATE = 'datetime64[us]'   # resolution of Python's datetime
+CACHE = True   # keep parsed csv files as binary arrays beside them (see cached)
+ISO_DATE = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+def to_dates(dates):
+    """datetime64 array of a date, list of dates or array of dates"""
+    return np.asarray(dates, dtype=DATE)
+
+def sort_points(dates, values):
+    """dates and values as new datetime64 and float64 arrays in date order,
+    a date given more than once keeping its last value"""
+    dates = np.array(dates, dtype=DATE)
+    values = np.array(values, dtype=float)
+    if len(dates) > 1 and not (dates[1:] > dates[:-1]).all():
+        order = np.argsort(dates, kind='stable')
+        dates, values = dates[order], values[order]
+        last = np.append(dates[1:] != dates[:-1], True)
+        if not last.all():
+            dates, values = dates[last], values[last]
+    return dates, values
+
+def file_hash(filename):
+    """sha1 hex digest of a file's contents"""
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+def cached(filename, column, parse):
+    """Parse a csv file once and keep the result beside it as memory-mappable
+    .npy arrays (filename.column.dates.npy and .values.npy) with a json key
+    (filename.column.json) of the csv's path, size, mtime and sha1. Later
+    calls map the arrays instead of parsing as long as the csv has the same
+    size and either the same path and mtime or the same sha1, and reparse
+    (rewriting the cache) otherwise. If the cache can't be written, the
+    parsed arrays are returned anyway.
+    :param column: what parse reads from the file (names the cache)
+    :param parse:  function of filename returning (dates, values, meta), meta
+                   being a json-able dict such as the title and unit
+    :return: (dates, values, meta) with dates sorted
+    """
+    if not CACHE:
+        dates, values, meta = parse(filename)
+        return sort_points(dates, values) + (meta,)
+    prefix = '{0}.{1}'.format(filename, column)
+    key = _file_key(filename)
+    found = _load_cache(filename, prefix, key)
+    if found is not None:
+        return found
+    dates, values, meta = parse(filename)
+    dates, values = sort_points(dates, values)
+    key.update(sha1=file_hash(filename), meta=meta)
+    try:
+        for suffix, array in (('.dates.npy', dates), ('.values.npy', values)):
+            with open(prefix + suffix + '.tmp', 'wb') as f:
+                np.save(f, array)
+            os.replace(prefix + suffix + '.tmp', prefix + suffix)
+        _write_json(prefix + '.json', key)
+    except OSError:
+        pass
+    return dates, values, meta
+
+def _file_key(filename):
+    stat = os.stat(filename)
+    return {'path': os.path.abspath(filename), 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+def _load_cache(filename, prefix, key):
+    """Memory-mapped (dates, values, meta) from the cache at prefix if it
+    is of the file as it is now (see cached), else None"""
+    try:
+        with open(prefix + '.json') as f:
+            saved = json.load(f)
+        if saved['size'] == key['size']:
+            same = saved['path'] == key['path'] and saved['mtime'] == key['mtime']
+            if not same and saved['sha1'] == file_hash(filename):
+                same = True
+                saved.update(key)
+                _write_json(prefix + '.json', saved)
+            if same:
+                return (np.load(prefix + '.dates.npy', mmap_mode='r'),
+                        np.load(prefix + '.values.npy', mmap_mode='r'), saved['meta'])
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+def _write_json(filename, obj):
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(obj, f)
+    os.replace(filename + '.tmp', filename)
+
+def read_fred(filename, column):
+    """(dates, values, {}) of a column of a FRED csv file, skipping days
+    without a number (FRED writes '.' for them), read in one pass"""
+    with open(filename) as csv_file:
+        lines = csv_file.read().splitlines()
+    header = lines[0].split(',')
+    table = read_table(lines[1:], len(header))
+    return parse_columns(table[:, header.index('DATE')], table[:, header.index(column)]) + ({},)
+
+def read_appended(filename, offset):
+    """Dated lines of a file from byte offset on, and the offset after the
+    last complete line (a line still being written is read next time)"""
+    with open(filename, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    lines = [line for line in data[:end].decode('utf8').splitlines() if ISO_DATE.match(line)]
+    return lines, offset + end
+
+def lines_end(filename):
+    """Byte offset just after a file's last complete line"""
+    with open(filename, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(end - 4096, 0)
+            f.seek(start)
+            block = f.read(end - start)
+            if b'\n' in block:
+                return start + block.rfind(b'\n') + 1
+            end = start
+    return 0
+
+def read_table(lines, ncols):
+    """2-D array of the cells of csv lines with ncols cells each, split in
+    bulk (falling back on the csv module for quoted or ragged lines)"""
+    while lines and not lines[-1]:
+        lines = lines[:-1]
+    text = ','.join(lines)
+    cells = text.split(',')
+    if '"' in text or len(cells) != ncols * len(lines):
+        rows = [(row + [''] * ncols)[:ncols] for row in csv.reader(lines)]
+        return np.array(rows, dtype=str).reshape(len(rows), ncols)
+    return np.array(cells).reshape(len(lines), ncols)
+
+def parse_columns(dates, values):
+    """(dates, values) arrays from arrays of ISO date strings and number
+    strings, converted in bulk and keeping only rows with a number"""
+    values = np.where((values == '.') | (values == ''), 'nan', values)
+    try:
+        numbers = values.astype(float)
+    except ValueError:
+        numbers = np.array([_float(value) for value in values])
+    keep = ~np.isnan(numbers)
+    return dates[keep].astype(DATE), numbers[keep]
+
+def _float(text):
+    """float of text, or nan if it isn't a number"""
+    try:
+        return float(text)
+    except ValueError:
+        return float('nan')
+
+
+class Registry(object):
+    """Process-wide cache of loaded and derived series, least recently used
+    first out once their arrays take more than max_bytes (the newest series
+    always stays). Series come out shared, so treat them as read-only (their
+    arrays are); clear() after the files under them change.
+    >>> from types import SimpleNamespace
+    >>> registry = Registry(max_bytes=100)
+    >>> a = registry.get('a', lambda: SimpleNamespace(nbytes=16))
+    >>> registry.get('a', None) is a, registry.stats()['hits'], registry.stats()['bytes']
+    (True, 1, 16)
+    """
+    def __init__(self, max_bytes=512 * 2**20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.sizes = {}   # nbytes of each entry as last counted
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        """The series cached under key, or load() cached under it"""
+        with self._lock:
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            self.misses += 1
+        series = load()
+        with self._lock:
+            if key not in self.entries:
+                self.entries[key] = series
+                self.sizes[key] = series.nbytes
+                self.bytes += series.nbytes
+                self._evict()
+            return self.entries.get(key, series)
+
+    def resize(self, key):
+        """Count the series cached under key at its present size (after it
+        has grown), evicting the least recently used if that is too much"""
+        with self._lock:
+            if key in self.entries:
+                nbytes = self.entries[key].nbytes
+                self.bytes += nbytes - self.sizes[key]
+                self.sizes[key] = nbytes
+                self._evict()
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            old_key, old = self.entries.popitem(last=False)
+            self.bytes -= self.sizes.pop(old_key)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """dict of hits, misses, evictions, entries and bytes"""
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self.entries), 'bytes': self.bytes}
+
+REGISTRY = Registry()
+
+class Shared(type):
+    """Metaclass for series classes with shared = True: calling one looks up
+    the series by its key, the class name and arguments (with series
+    arguments replaced by their keys, so a series derived from named ones
+    is cached by what it is built from), and only builds it on a miss.
+    Series with any argument that has no key are built as usual."""
+    def __call__(cls, *args, **kwargs):
+        key = cls.shared and series_key(cls, args, kwargs)
+        if not key:
+            return super().__call__(*args, **kwargs)
+        def load():
+            series = super(Shared, cls).__call__(*args, **kwargs)
+            series.key = key
+            return series
+        return REGISTRY.get(key, load)
+
+def series_key(cls, args, kwargs):
+    """Registry key of cls(*args, **kwargs), or None if it has none"""
+    key = [cls.__module__, cls.__name__]
+    for name, value in [(None, arg) for arg in args] + sorted(kwargs.items()):
+        if isinstance(value, TimeSeries):
+            value = value.key
+            if value is None:
+                return None
+        try:
+            hash(value)
+        except TypeError:
+            return None
+        key.append(value if name is None else (name, value))
+    return tuple(key)
+
+class Points(Mapping):
+    """Read-only dict-like view of a series' points, datetime to value,
+    looked up in its arrays (so it follows appends). Points are changed
+    with the series' set_data or append, not through the view.
+    >>> ts = TimeSeries('a', dates=[datetime(2018,1,2), datetime(2018,1,1)], values=[2, 1])
+    >>> ts.data[datetime(2018,1,2)], datetime(2018,1,3) in ts.data, len(ts.data)
+    (2.0, False, 2)
+    >>> ts.data[datetime(2018,1,3)] = 3
+    Traceback (most recent call last):
+    ...
+    TypeError: a's points are changed with set_data or append
+    """
+    def __init__(self, series):
+        self.series = series
+
+    def __getitem__(self, date):
+        return self.series.values[self.series.index([date])[0]].item()
+
+    def __setitem__(self, date, value):
+        raise TypeError("{0}'s points are changed with set_data or append".format(self.series.name))
+
+    def __delitem__(self, date):
+        self[date] = None
+
+    def __iter__(self):
+        return iter(self.series.dates.tolist())
+
+    def __len__(self):
+        return len(self.series.dates)
+
+
+class TimeSeries(object, metaclass=Shared):
+    """Holds a date/value series of data as two parallel arrays: dates, a
+    sorted datetime64 array, and values, a float64 array.
+    Named and derived series (classes with shared = True) come from REGISTRY,
+    so building one a second time returns the same object.
+    append() adds later points in place, and refresh() those written to the
+    series' file since it was read; derived series built on it (its
+    dependents) are brought up to date by computing just their new points.
+    >>> ts = TimeSeries('a', data={datetime(2018,1,i):i for i in range(19,9,-3)})
+    >>> ts.get_dates(start=datetime(2018,1,11)).tolist()
+    [datetime.datetime(2018, 1, 13, 0, 0), datetime.datetime(2018, 1, 16, 0, 0), datetime.datetime(2018, 1, 19, 0, 0)]
+    >>> ts.get_values(ts.get_dates([datetime(2018,1,i) for i in (19,11,10)])).tolist()
+    [19.0, 10.0]
+    >>> diff = ts - TimeSeries('b', data={datetime(2018,1,i):1 for i in (19,22)})
+    >>> ts.append([datetime(2018,1,22)], [22])
+    >>> diff.get_values(diff.get_dates()).tolist()
+    [18.0, 21.0]
+    """
+    shared = False
+    mapped = False   # arrays are memory-mapped files, too big to copy
+    version = 0      # counts changes to the points (see Expression.lazy)
+
+    def __init__(self, name, title=None, unit=None, data=None, dates=None, values=None):
+        """
+        :param data:   dict of date to value (in any order)
+        :param dates:  dates, used with values instead of data
+        :param values: value on each date
+        """
+        self.name = name
+        self.title = title
+        self.unit = unit
+        self.key = None
+        self.filename = None   # file the points are read from, if any
+        self.offset = 0        # bytes of it read so far
+        self.dependents = weakref.WeakSet()
+        self._spare = None
+        if data is not None:
+            self.data = data
+        else:
+            self.set_data([] if dates is None else dates, [] if values is None else values)
+
+    def set_data(self, dates, values):
+        """Replace the series' points (sorting them by date if need be)"""
+        self._store(*sort_points(dates, values))
+
+    def _store(self, dates, values):
+        """Keep sorted arrays (or read-only views) as the series' points
+        without copying them"""
+        dates.flags.writeable = False
+        values.flags.writeable = False
+        self.dates = dates
+        self.values = values
+        self._spare = None
+        self.version += 1
+
+    def append(self, dates, values):
+        """Add points dated after the series' last date, growing its arrays
+        in place (with room to spare, so appending is amortized O(new
+        points)), then update the dependents
+        :raises: ValueError  if a new date is not after the last date
+        """
+        dates, values = sort_points(dates, values)
+        if not len(dates):
+            return
+        n, m = len(self.dates), len(dates)
+        if n and dates[0] <= self.dates[-1]:
+            raise ValueError('{0} is not after the last date of {1}'.format(dates[0], self.name))
+        spare = self._spare
+        if spare is None or len(spare[0]) < n + m:
+            size = max(2 * (n + m), 16)
+            spare = np.empty(size, DATE), np.empty(size)
+            spare[0][:n], spare[1][:n] = self.dates, self.values
+        spare[0][n:n + m], spare[1][n:n + m] = dates, values
+        self._store(spare[0][:n + m], spare[1][:n + m])
+        self._spare = spare
+        if self.key is not None:
+            REGISTRY.resize(self.key)
+        for dependent in list(self.dependents):
+            dependent.update(self)
+
+    def update(self, source):
+        """Append the points due to source's new ones (derived series)"""
+        pass
+
+    def refresh(self):
+        """Append the points written to the series' file since it was last
+        read, reading only the new bytes (a file that has shrunk is read
+        again from the start, keeping dates after the last one)
+        :return: number of points added
+        """
+        if self.filename is None:
+            return 0
+        if os.path.getsize(self.filename) < self.offset:
+            self.offset = 0
+        lines, self.offset = read_appended(self.filename, self.offset)
+        if not lines:
+            return 0
+        dates, values = self.parse_lines(lines)
+        if len(self.dates):
+            keep = dates > self.dates[-1]
+            dates, values = dates[keep], values[keep]
+        self.append(dates, values)
+        return len(dates)
+
+    @property
+    def data(self):
+        """read-only mapping of datetime to value (see Points)"""
+        return Points(self)
+
+    @data.setter
+    def data(self, data):
+        self.set_data(list(data.keys()), list(data.values()))
+
+    @property
+    def first_date(self):
+        return self.dates[0].item() if len(self.dates) else None
+
+    @property
+    def last_date(self):
+        return self.dates[-1].item() if len(self.dates) else None
+
+    def __len__(self):
+        return len(self.dates)
+
+    @property
+    def nbytes(self):
+        """bytes held in memory by the dates and values arrays, with any
+        room kept for appending (none for memory-mapped ones, whose pages
+        belong to the operating system)"""
+        if self.mapped:
+            return 0
+        if self._spare is not None:
+            return self._spare[0].nbytes + self._spare[1].nbytes
+        return self.dates.nbytes + self.values.nbytes
+
+    def index(self, dates):
+        """Positions of dates in the series
+        :raises: KeyError  if any date has no value
+        """
+        dates = to_dates(dates)
+        i = np.searchsorted(self.dates, dates)
+        found = i < len(self.dates)
+        found[found] = self.dates[i[found]] == dates[found]
+        if not found.all():
+            raise KeyError(dates[~found][0].item())
+        return i
+
+    def get_dates(self, candidates=None, start=None, end=None):
+        """Get the dates where this series has values
+        ts.get_dates() - gets all dates where ts has values
+        ts.get_dates(start=d1,end=d2) - get all valid dates, d, 
+                                        where d1<=d<=d2
+        ts.get_dates(candidates=dates) - get all valid dates, d, 
+                                         for d in dates
+        :param candidates: if set, start and end are ignored, and 
+                           returns the subset of dates within 
+                           candidates for which this series has data
+        :param start:      minimum starting date of returned dates, 
+                           defaults to beginning of this series
+        :param end:        max ending date of returned dates, 
+                           defaults to end of this series
+        :return:           a datetime64 array of the dates, in order,
+                           for which this series has values and that
+                           satisfy the parameters' conditions
+        """
+        if candidates is not None:
+            candidates = to_dates(candidates)
+            i = np.searchsorted(self.dates, candidates)
+            found = i < len(self.dates)
+            found[found] = self.dates[i[found]] == candidates[found]
+            return candidates[found]
+        lo = 0 if start is None else np.searchsorted(self.dates, to_dates(start), 'left')
+        hi = len(self.dates) if end is None else np.searchsorted(self.dates, to_dates(end), 'right')
+        return self.dates[lo:hi]
+
+    def get_values(self, dates):
+        """Get the values for the specified dates.
+        :param dates:      dates to get values for
+        :return:           array of the values for the given dates in the
+                           same order (a read-only view when the dates
+                           are a run of the series' own)
+        :raises: KeyError  if any requested date has no value
+        """
+        dates = to_dates(dates)
+        if len(dates):
+            lo = np.searchsorted(self.dates, dates[0])
+            if np.array_equal(self.dates[lo:lo + len(dates)], dates):
+                return self.values[lo:lo + len(dates)]
+        return self.values[self.index(dates)]
+
+    def __sub__(self, other):
+        """create a difference time series"""
+        return Difference(self, other)
+
+    def correlation(self, other):
+        """Calculate the Pearson correlation coefficient between this series
+        and another on all days when they both have values.
+        Uses scipy.stats.pearsonr to calculate it (or, for memory-mapped
+        series, streamed_correlation).
+        """
+        if self.mapped or other.mapped:
+            return streamed_correlation(self, other)
+        dates, mine, theirs = np.intersect1d(self.dates, other.dates, assume_unique=True,
+                                             return_indices=True)
+        r,p=stats.pearsonr(self.values[mine], other.values[theirs])
+        return r
+
+
+class Difference(TimeSeries):
+    """A time series that is the difference between two other time series"""
+    shared = True
+
+    def __init__(self, a, b):
+        if a.mapped or b.mapped:   # joined a block at a time into a temporary file
+            super().__init__(a.name + '-' + b.name, unit=a.unit)
+            self._store(*spill((a.dates[ia], a.values[ia] - b.values[ib])
+                               for ia, ib in common_blocks(a.dates, b.dates)))
+            self.mapped = True
+        else:
+            dates, ia, ib = np.intersect1d(a.dates, b.dates, assume_unique=True, return_indices=True)
+            super().__init__(a.name + '-' + b.name, unit=a.unit, dates=dates,
+                             values=a.values[ia] - b.values[ib])
+        self.a, self.b = a, b
+        a.dependents.add(self)
+        b.dependents.add(self)
+
+    def update(self, source):
+        """append a - b on the dates both have after the last one"""
+        a, b = self.a, self.b
+        ta = tb = 0
+        if len(self.dates):
+            ta = np.searchsorted(a.dates, self.dates[-1], 'right')
+            tb = np.searchsorted(b.dates, self.dates[-1], 'right')
+        dates, ia, ib = np.intersect1d(a.dates[ta:], b.dates[tb:], assume_unique=True,
+                                       return_indices=True)
+        self.append(dates, a.values[ta:][ia] - b.values[tb:][ib])
+
+
+class Fred(TimeSeries):
+    """A time series that is based on a csv file downloaded from 
+    fred.stlouis.org
+    """
+    shared = True
+
+    def __init__(self, name, title=None, unit=None, column=None):
+        """Opens and reads the csv file in DATA/name.csv (see cached)
+        :param column: header of the values in the file (defaults to name)
+        """
+        super().__init__(name.lower(), title, unit)
+        self.column = column = column or name
+        self.filename = os.path.join(DATA, name + '.csv')
+        self.offset = lines_end(self.filename)
+        dates, values, meta = cached(self.filename, column, lambda filename: read_fred(filename, column))
+        self._store(dates, values)
+
+    def parse_lines(self, lines):
+        """(dates, values) of data lines of the csv file"""
+        with open(self.filename) as csv_file:
+            header = csv_file.readline().strip().split(',')
+        table = read_table(lines, len(header))
+        return parse_columns(table[:, header.index('DATE')], table[:, header.index(self.column)])
+
+def common_blocks(a, b, chunk=65536):
+    """Generator of (ia, ib), the positions in sorted date arrays a and b
+    of the dates both have, chunk of a's dates at a time (to join series
+    too big to join in memory)"""
+    for lo in range(0, len(a), chunk):
+        block = a[lo:lo + chunk]
+        blo = np.searchsorted(b, block[0])
+        bhi = np.searchsorted(b, block[-1], 'right')
+        dates, ia, ib = np.intersect1d(block, b[blo:bhi], assume_unique=True, return_indices=True)
+        yield ia + lo, ib + blo
+
+def streamed_correlation(a, b, chunk=65536):
+    """Pearson correlation coefficient of two series over the dates both
+    have, combining each block's means and co-moments as it goes (Chan et
+    al.) so neither series is read into memory whole"""
+    n = mx = my = cxx = cyy = cxy = 0.0
+    for ia, ib in common_blocks(a.dates, b.dates, chunk):
+        if not len(ia):
+            continue
+        x, y = a.values[ia], b.values[ib]
+        m, bx, by = len(x), x.mean(), y.mean()
+        x, y = x - bx, y - by
+        dx, dy, total = bx - mx, by - my, n + m
+        cxx += x @ x + dx * dx * n * m / total
+        cyy += y @ y + dy * dy * n * m / total
+        cxy += x @ y + dx * dy * n * m / total
+        mx, my, n = mx + dx * m / total, my + dy * m / total, total
+    if n < 2 or not cxx or not cyy:
+        return float('nan')
+    return cxy / np.sqrt(cxx * cyy)
+
+def spill(chunks):
+    """Memory-mapped (dates, values) of chunks of (dates, values) in date
+    order, written to anonymous temporary files (gone once unmapped)"""
+    with tempfile.TemporaryFile() as dates_file, tempfile.TemporaryFile() as values_file:
+        n = 0
+        for dates, values in chunks:
+            dates_file.write(to_dates(dates).tobytes())
+            values_file.write(np.asarray(values, dtype=float).tobytes())
+            n += len(dates)
+        if not n:
+            return np.empty(0, DATE), np.empty(0)
+        dates_file.flush()
+        values_file.flush()
+        return (np.memmap(dates_file, dtype=DATE, mode='r', shape=(n,)),
+                np.memmap(values_file, dtype=float, mode='r', shape=(n,)))
+
+
+class Frame(object):
+    """Several series aligned on one shared, sorted date index, with their
+    values as the columns of a 2-D array (each column contiguous)
+    how='inner' - dates every series has
+    how='outer' - dates any series has, nan where a series has none
+    how='asof'  - the first series' dates, each other series taking its
+                  latest value on or before the date (nan before its first)
+    >>> a = TimeSeries('a', data={datetime(2018,1,i):i for i in range(10,20,3)})
+    >>> b = TimeSeries('b', data={datetime(2018,1,i):-i for i in range(11,20)})
+    >>> Frame([a, b]).values.tolist()
+    [[13.0, -13.0], [16.0, -16.0], [19.0, -19.0]]
+    >>> Frame([a, b], 'asof').column('b').tolist()
+    [nan, -13.0, -16.0, -19.0]
+    >>> len(Frame([a, b], 'outer', end=datetime(2018,1,15)).dates)
+    6
+    """
+    def __init__(self, series, how='inner', start=None, end=None):
+        """
+        :param series: TimeSeries objects to align (columns in this order)
+        :param how:    'inner', 'outer' or 'asof' (see above)
+        :param start:  first date to keep (defaults to the beginning)
+        :param end:    last date to keep (defaults to the end)
+        """
+        self.names = [s.name for s in series]
+        columns = [(s.get_dates(start=start, end=end), s.values) for s in series]
+        if how == 'asof':
+            index = columns[0][0]
+        else:
+            # one sort of every date: each series has a date at most once
+            merged, counts = np.unique(np.concatenate([dates for dates, values in columns]),
+                                       return_counts=True)
+            index = merged[counts == len(columns)] if how == 'inner' else merged
+        self.dates = index
+        self.values = np.full((len(index), len(columns)), np.nan, order='F')
+        for j, s in enumerate(series):
+            if how == 'asof':
+                i = np.searchsorted(s.dates, index, 'right') - 1
+                found = i >= 0
+            else:
+                i = np.searchsorted(s.dates, index)
+                found = i < len(s.dates)
+                found[found] = s.dates[i[found]] == index[found]
+            self.values[found, j] = s.values[i[found]]
+
+    def column(self, key):
+        """values of a series by position or name (a view)"""
+        return self.values[:, key if isinstance(key, int) else self.names.index(key)]
+
+    def rows(self, start=None, end=None):
+        """slice of the rows from start to end"""
+        lo = 0 if start is None else np.searchsorted(self.dates, to_dates(start), 'left')
+        hi = len(self.dates) if end is None else np.searchsorted(self.dates, to_dates(end), 'right')
+        return slice(lo, hi)
+
+    def window(self, start=None, end=None):
+        """Frame of the rows from start to end (views of this one)"""
+        rows = self.rows(start, end)
+        frame = Frame.__new__(Frame)
+        frame.names, frame.dates, frame.values = self.names, self.dates[rows], self.values[rows]
+        return frame
+
+    def correlation(self):
+        """matrix of Pearson correlation coefficients between the columns"""
+        return np.corrcoef(self.values, rowvar=False)
+
+    def series(self, key):
+        """a column as a TimeSeries (dropping nan)"""
+        values = self.column(key)
+        keep = ~np.isnan(values)
+        name = key if isinstance(key, str) else self.names[key]
+        return TimeSeries(name, dates=self.dates[keep], values=values[keep])
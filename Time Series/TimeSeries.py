@@ -1,104 +1,79 @@
 import os
 import csv
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from datetime import datetime, timedelta
 import matplotlib.pyplot as plt
 from scipy import stats
 from fractions import *
+import numpy as np
 
-DATA=os.getcwd()
-
-class TimeSeries(object):
-    """Holds a date/value series of data"""
-    def __init__(self, name, title=None, unit=None):
-        self.name = name
-        self.title = title
-        self.unit = unit
-        self.data = {}
-        self.first_date = None
-        self.last_date = None
-
-    def get_dates(self, candidates=None, start=None, end=None):
-        """Get the dates where this series has values
-        ts.get_dates() - gets all dates where ts has values
-        ts.get_dates(start=d1,end=d2) - get all valid dates, d, 
-                                        where d1<=d<=d2
-        ts.get_dates(candidates=dates) - get all valid dates, d, 
-                                         for d in dates
-        :param candidates: if set, start and end are ignored, and 
-                           returns the subset of dates within 
-                           candidates for which this series has data
-        :param start:      minimum starting date of returned dates, 
-                           defaults to beginning of this series
-        :param end:        max ending date of returned dates, 
-                           defaults to end of this series
-        :return:           a list of dates, in order, for which
-                           this series has values and that satisfy
-                           the parameters' conditions
-        """
-        if candidates is not None:
-            return [date for date in candidates if date in self.data]
-        if start is None:
-            start = self.first_date
-        if end is None:
-            end = self.last_date
-        return [date for date in self.data if start <= date <= end]
-
-    def get_values(self, dates):
-        """Get the values for the specified dates.
-        :param dates:      list of dates to get values for
-        :return:           the values for the given dates in the same order
-        :raises: KeyError  if any requested date has no value
-        """
-        ret = []
-        for d in dates:
-            ret.append(self.data[d])
-        return ret
-
-    def __sub__(self, other):
-        """create a difference time series"""
-        return Difference(self, other)
-
-    def correlation(self, other):
-        """Calculate the Pearson correlation coefficient between this series
-        and another on all days when they both have values.
-        Uses scipy.stats.pearsonr to calculate it.
-        """
-        dates=self.get_dates(other.get_dates())
-        #print(len(self.get_values(dates)))
-        #print(len(other.get_values(dates)))
-        #print(self.get_values(dates))
-        r,p=stats.pearsonr(self.get_values(dates), other.get_values(dates))
-        return r
-        
-
-
-class Difference(TimeSeries):
-    """A time series that is the difference between two other time series"""
-    def __init__(self, a, b):
-        super().__init__(a.name + '-' + b.name, unit=a.unit)
-        self.data = {d: (a.data[d] - b.data[d]) for d in a.data if d in b.data}
-        self.first_date = min(self.data)
-        self.last_date = max(self.data)
-
-class Fred(TimeSeries):
-    """A time series that is based on a csv file downloaded from 
-    fred.stlouis.org
+# the series classes, loaders, registry and Frame shared with Best
+# Regression FSS/p3.py are in SeriesData.py
+from SeriesData import (DATA, DATE, ISO_DATE, to_dates, sort_points, file_hash, cached,
+                        _file_key, _load_cache, _write_json, lines_end, read_table,
+                        parse_columns, REGISTRY, TimeSeries, Difference, Fred, Frame)
+
+
+def stream(filename, column=None, chunk=65536):
+    """Generator of (dates, values) arrays of a csv file, chunk lines at a
+    time, so a file of any size is read in fixed memory. Dates may have
+    times of day (intraday data).
+    :param column: header of the value column, dates being in the DATE
+                   column (FRED's layout), or None for dates and values in
+                   the first two columns of the dated lines (Bundesbank's)
     """
-    def __init__(self, name, title=None, unit=None):
-        """Opens and reads the csv file in DATA/name.csv"""
-        super().__init__(name.lower(), title, unit)
-        filename = os.path.join(DATA, name + '.csv')
-        with open(filename) as csv_file:
-            reader = csv.DictReader(csv_file)
-            for row in reader:
-                try:
-                    value = float(row[name])
-                except ValueError:
-                    continue
-                date = datetime.strptime(row['DATE'], "%Y-%m-%d")
-                self.data[date] = value
-        self.first_date = min(self.data)
-        self.last_date = max(self.data)
+    columns = 0, 1
+    if column is not None:
+        with open(filename, encoding='utf8') as csv_file:
+            header = csv_file.readline().strip().split(',')
+        columns = header.index('DATE'), header.index(column)
+    with open(filename, encoding='utf8') as csv_file:
+        while True:
+            lines = [line.rstrip('\r\n') for line in itertools.islice(csv_file, chunk)]
+            if not lines:
+                return
+            lines = [line for line in lines if ISO_DATE.match(line)]
+            if lines:
+                table = read_table(lines, len(next(csv.reader(lines[:1]))))
+                yield parse_columns(table[:, columns[0]], table[:, columns[1]])
+
+def map_csv(filename, column=None, chunk=65536):
+    """Memory-mapped (dates, values) of a csv file too big to parse in
+    memory: the file is streamed a chunk at a time into the .npy files
+    cached() keeps (the two share them), which are reused the same way
+    :param column: as for stream
+    :raises: ValueError  if the file's dates go back in time across chunks
+    """
+    prefix = '{0}.{1}'.format(filename, column or 'columns')
+    key = _file_key(filename)
+    found = _load_cache(filename, prefix, key)
+    if found is not None:
+        return found[:2]
+    n, last = 0, None
+    with open(prefix + '.dates.tmp', 'wb') as dates_file, open(prefix + '.values.tmp', 'wb') as values_file:
+        for dates, values in stream(filename, column, chunk):
+            dates, values = sort_points(dates, values)
+            if n and len(dates) and dates[0] <= last:
+                raise ValueError('{0} is not in date order at {1}'.format(filename, dates[0]))
+            dates_file.write(dates.tobytes())
+            values_file.write(values.tobytes())
+            n += len(dates)
+            last = dates[-1] if len(dates) else last
+    for suffix, dtype in (('.dates', DATE), ('.values', float)):
+        raw = np.memmap(prefix + suffix + '.tmp', dtype=dtype, mode='r') if n else None
+        array = np.lib.format.open_memmap(prefix + suffix + '.npy.tmp', 'w+', dtype, (n,))
+        for i in range(0, n, chunk):
+            array[i:i + chunk] = raw[i:i + chunk]
+        array.flush()
+        del array, raw
+        os.replace(prefix + suffix + '.npy.tmp', prefix + suffix + '.npy')
+        os.remove(prefix + suffix + '.tmp')
+    key.update(sha1=file_hash(filename), meta={})
+    _write_json(prefix + '.json', key)
+    return (np.load(prefix + '.dates.npy', mmap_mode='r'),
+            np.load(prefix + '.values.npy', mmap_mode='r'))
 
 
 class dgs3mo(Fred):
@@ -117,37 +92,45 @@ class Bundesbank(TimeSeries):
     """A time series that is based on a csv file downloaded from 
     fred.stlouis.org
     """
+    shared = True
+
     def __init__(self, className, name, title=None, unit=None):
-        """Opens and reads the csv file in Lab3/BBEX3.D.XAU.USD.EA.AC.C04.csv"""
+        """Opens and reads the csv file in DATA/name.csv (see cached), taking
+        title and unit from the file's header rows when it has them"""
         self.className = className
         filename = os.path.join(DATA, name + '.csv')
-        with open(filename,encoding='utf8') as csv_file:
-            reader = csv.reader(csv_file)
-            for row_number, row in enumerate(reader):
-                if row[1] == filename:
-                    continue
-                if row[0] == '':
-                    self.title = row[1]
-                    continue
-                if row[0] == 'unit':
-                    self.unit = row[1]
-                    continue
-                try:
-                    datetime.strptime(row[0], "%Y-%m-%d")
-                    break
-                except: ValueError
-        super().__init__(name, title, unit)
-        with open(filename,encoding='utf8') as csv_file:
-            reader = csv.reader(csv_file)
-            for skip in range(row_number):  # row_number is first data line
-                next(reader)
-            for row in reader:
-                try:
-                    self.data[datetime.strptime(row[0], "%Y-%m-%d")]=float(row[1])
-                except: ValueError
-            self.first_date=min(self.data.keys())
-            self.last_date=max(self.data.keys())
-              
+        offset = lines_end(filename)
+        dates, values, meta = cached(filename, 'bundesbank', read_bundesbank)
+        super().__init__(name, meta.get('title', title), meta.get('unit', unit))
+        self.filename, self.offset = filename, offset
+        self._store(dates, values)
+
+    def parse_lines(self, lines):
+        """(dates, values) of dated lines of the csv file"""
+        table = read_table(lines, len(next(csv.reader(lines[:1]), [])))
+        return parse_columns(table[:, 0], table[:, 1])
+
+def read_bundesbank(filename):
+    """(dates, values, {'title': ..., 'unit': ...}) of a Bundesbank csv file,
+    read in one pass: header rows up to the first dated row give the title
+    (the last one with an empty first column) and unit"""
+    meta = {}
+    with open(filename,encoding='utf8') as csv_file:
+        lines = csv_file.read().splitlines()
+    first = 0
+    while first < len(lines) and not ISO_DATE.match(lines[first]):
+        first += 1
+    for row in csv.reader(lines[:first]):
+        if len(row) < 2:
+            continue
+        if row[0] == '':
+            meta['title'] = row[1]
+        elif row[0] == 'unit':
+            meta['unit'] = row[1]
+    table = read_table(lines[first:], len(next(csv.reader(lines[first:first + 1]), [])))
+    return parse_columns(table[:, 0], table[:, 1]) + (meta,)
+
+
 class gold_spot(Bundesbank):
     """Spot gold prices from London morning fix
     >>> gold = gold_spot()
@@ -164,6 +147,30 @@ class gold_spot(Bundesbank):
         """
         super().__init__(self.__class__.__name__, 'BBEX3.D.XAU.USD.EA.AC.C04')
 
+class Mapped(TimeSeries):
+    """A time series left on disk, for data too big for memory such as
+    minute-level FX and commodity prices: DATA/name.csv is streamed a chunk
+    at a time into .npy files (see map_csv) whose memory maps are the dates
+    and values, so lookups read only the pages they touch. get_dates and
+    get_values search the maps, and correlation and Difference with a
+    Mapped series join a block at a time. It can't be appended to.
+    >>> bool(Mapped('DGS10', 'DGS10').correlation(dgs10()) > 0.999999)
+    True
+    """
+    shared = True
+    mapped = True
+
+    def __init__(self, name, column=None, title=None, unit=None, chunk=65536):
+        """
+        :param column: as for stream (None for Bundesbank's layout)
+        """
+        super().__init__(name, title, unit)
+        self._store(*map_csv(os.path.join(DATA, name + '.csv'), column, chunk))
+
+    def append(self, dates, values):
+        raise TypeError('{0} is memory-mapped and read-only'.format(self.name))
+
+
 class lag(TimeSeries):
     """Time series that is a right-shifted copy of another.
     Shifting is done across a given number of data points, ignoring actual
@@ -171,73 +178,209 @@ class lag(TimeSeries):
     Thursday to Friday and Friday to Monday, ignoring the weekend where
     there are no points)
     >>> lagger = lag(TimeSeries('a', data={datetime(2018,1,i):i for i in range(10,20,3)}), 2)
-    >>> lagger.get_dates()
+    >>> lagger.get_dates().tolist()
     [datetime.datetime(2018, 1, 16, 0, 0), datetime.datetime(2018, 1, 19, 0, 0)]
-    >>> lagger.get_values(lagger.get_dates())
-    [10, 13]
+    >>> lagger.get_values(lagger.get_dates()).tolist()
+    [10.0, 13.0]
     """
-   
+    shared = True
+
     def __init__(self, timeSeries, shift_days=0):
-        self.name = timeSeries.name
-        self.title = timeSeries.title
-        self.unit = timeSeries.unit
+        super().__init__(timeSeries.name, timeSeries.title, timeSeries.unit)
         self.shift_days = shift_days
+        self._store(*self.get_right_shifted_data(timeSeries))
+        timeSeries.dependents.add(self)
 
-        self.data = self.get_right_shifted_data(timeSeries)
-        self.first_date = min(self.data)
-        self.last_date = max(self.data)
+    def update(self, timeSeries):
+        """append the points for timeSeries' new tail"""
+        k, n = len(self.dates), len(timeSeries.dates)
+        self.append(timeSeries.dates[self.shift_days + k:],
+                    timeSeries.values[k:max(n - self.shift_days, k)])
 
     def get_right_shifted_data(self, timeSeries):
-        data = {}
-        for key, value in timeSeries.data.items():
-            days_to_add = self.shift_days
-            while days_to_add > 0:
-                key += timedelta(days=1)
-                if key > timeSeries.last_date:
-                    break
-                if key in timeSeries.data:
-                    days_to_add -= 1
-                else:
-                    continue
-            if key <= timeSeries.last_date:        
-                data[key] = value
-        return data
+        """(dates, values) with each value moved shift_days points later,
+        as views of timeSeries' arrays"""
+        n = len(timeSeries.dates) - self.shift_days
+        return timeSeries.dates[self.shift_days:], timeSeries.values[:max(n, 0)]
  
 class returns(TimeSeries):
     """Time series that is profit ratio of buying the asset at time t[0]
     and selling it at time t[n]. Value is (t[n]-t[0])/t[0].
     >>> inv = returns(TimeSeries('a', data={datetime(2018,1,i):i for i in range(10,20,3)}), 1)
-    >>> inv.get_dates()
+    >>> inv.get_dates().tolist()
     [datetime.datetime(2018, 1, 13, 0, 0), datetime.datetime(2018, 1, 16, 0, 0), datetime.datetime(2018, 1, 19, 0, 0)]
-    >>> inv.get_values(inv.get_dates()) == [3/10, 3/13, 3/16]
+    >>> inv.get_values(inv.get_dates()).tolist() == [3/10, 3/13, 3/16]
     True
     """
+    shared = True
+
     def __init__(self, timeSeries, hold_days=0):
-        self.name = timeSeries.name
-        self.title = timeSeries.title
-        self.unit = timeSeries.unit
+        super().__init__(timeSeries.name, timeSeries.title, timeSeries.unit)
         self.hold_days = hold_days
-        self.data = self.get_return_data(timeSeries)
-        self.first_date = min(self.data)
-        self.last_date = max(self.data)
+        self._store(*self.get_return_data(timeSeries))
+        timeSeries.dependents.add(self)
+
+    def update(self, timeSeries):
+        """append the returns of sales at timeSeries' new points"""
+        k, n, h = len(self.dates), len(timeSeries.dates), self.hold_days
+        values = timeSeries.values
+        bought = values[k:max(n - h, k)]
+        self.append(timeSeries.dates[h + k:], (values[h + k:] - bought) / bought)
 
     def get_return_data(self, timeSeries):
-        data = {}
-        for key, value in timeSeries.data.items():
-            old_date = key
-            days_to_add = self.hold_days
-            while days_to_add > 0:
-                key += timedelta(days=1)
-                if key > timeSeries.last_date:
-                    break
-                if key in timeSeries.data:
-                    days_to_add -= 1
-                else:
-                    continue
-            if key <= timeSeries.last_date:        
-                data[key] = (timeSeries.data[key] - value)/value
-                #data[key] = Fraction(timeSeries.data[key] - value,value)
-        return data
+        """(dates, values) of the return of holding from each point to the
+        point hold_days later, dated at the sale"""
+        values = timeSeries.values
+        bought = values[:max(len(values) - self.hold_days, 0)]
+        return timeSeries.dates[self.hold_days:], (values[self.hold_days:] - bought) / bought
+
+def rolling_sums(dates, window, columns, min_points=1):
+    """Sums of columns over a moving window ending at each date, in O(n)
+    from cumulative sums.
+    :param window:     an int for that many points (missing days don't
+                       count, as for lag and returns) or a timedelta for
+                       the points in the preceding span of time, ending
+                       at and including each date
+    :param columns:    arrays aligned with dates (center them first to
+                       keep the sums accurate)
+    :param min_points: fewest points a window needs for its date to be kept
+                       (an int window smaller than this keeps none)
+    :return: (dates kept, number of points in each window, list of sums)
+    """
+    end = np.arange(1, len(dates) + 1)
+    if isinstance(window, (int, np.integer)):
+        start = end - window
+        keep = (start >= 0) & (window >= min_points)
+    else:
+        start = np.searchsorted(dates, dates - np.timedelta64(window), 'right')
+        keep = end - start >= min_points
+    start, end = start[keep], end[keep]
+    sums = []
+    for column in columns:
+        total = np.zeros(len(column) + 1)
+        np.cumsum(column, out=total[1:])
+        sums.append(total[end] - total[start])
+    return dates[keep], (end - start).astype(float), sums
+
+def _paired(a, b):
+    """dates both series have and their values on them"""
+    dates, ia, ib = np.intersect1d(a.dates, b.dates, assume_unique=True, return_indices=True)
+    return dates, a.values[ia], b.values[ib]
+
+class rolling_mean(TimeSeries):
+    """Time series of the mean of another over a moving window (see
+    rolling_sums) ending at each date
+    >>> ts = TimeSeries('a', data={datetime(2018,1,i):i for i in (1,2,3,5,8)})
+    >>> rolling_mean(ts, 2).values.tolist()
+    [1.5, 2.5, 4.0, 6.5]
+    >>> rolling_mean(ts, timedelta(days=2)).values.tolist()
+    [1.0, 1.5, 2.5, 5.0, 8.0]
+    """
+    shared = True
+
+    def __init__(self, timeSeries, window):
+        super().__init__(timeSeries.name, timeSeries.title, timeSeries.unit)
+        self.window = window
+        center = timeSeries.values.mean() if len(timeSeries) else 0.0
+        dates, n, (sx,) = rolling_sums(timeSeries.dates, window, [timeSeries.values - center])
+        self._store(dates, sx / n + center)
+
+class rolling_std(TimeSeries):
+    """Time series of the standard deviation of another over a moving window
+    (see rolling_sums) ending at each date, with ddof=1 by default as for a
+    sample (windows need more than ddof points)"""
+    shared = True
+
+    def __init__(self, timeSeries, window, ddof=1):
+        super().__init__(timeSeries.name, timeSeries.title, timeSeries.unit)
+        self.window = window
+        x = timeSeries.values - (timeSeries.values.mean() if len(timeSeries) else 0.0)
+        dates, n, (sx, sxx) = rolling_sums(timeSeries.dates, window, [x, x * x], ddof + 1)
+        self._store(dates, np.sqrt(np.maximum(sxx - sx * sx / n, 0) / (n - ddof)))
+
+class rolling_cov(TimeSeries):
+    """Time series of the covariance of two series over a moving window (see
+    rolling_sums) of the dates both have, with ddof=1 by default"""
+    shared = True
+
+    def __init__(self, a, b, window, ddof=1):
+        super().__init__(a.name + '~' + b.name)
+        self.window = window
+        dates, x, y = _paired(a, b)
+        if len(dates):
+            x, y = x - x.mean(), y - y.mean()
+        dates, n, (sx, sy, sxy) = rolling_sums(dates, window, [x, y, x * y], ddof + 1)
+        self._store(dates, (sxy - sx * sy / n) / (n - ddof))
+
+class rolling_corr(TimeSeries):
+    """Time series of the Pearson correlation coefficient of two series over
+    a moving window (see rolling_sums) of the dates both have (nan where
+    either is constant over the window)
+    >>> a = TimeSeries('a', data={datetime(2018,1,i):i for i in range(1,9)})
+    >>> b = TimeSeries('b', data={datetime(2018,1,i):i*i for i in range(1,9)})
+    >>> r = rolling_corr(a, b, 4)
+    >>> bool(abs(r.values[-1] - stats.pearsonr([5,6,7,8], [25,36,49,64])[0]) < 1e-12)
+    True
+    """
+    shared = True
+
+    def __init__(self, a, b, window):
+        super().__init__(a.name + '~' + b.name)
+        self.window = window
+        dates, x, y = _paired(a, b)
+        if len(dates):
+            x, y = x - x.mean(), y - y.mean()
+        dates, n, (sx, sy, sxx, syy, sxy) = rolling_sums(dates, window, [x, y, x * x, y * y, x * y], 2)
+        cov = sxy - sx * sy / n
+        var = np.maximum(sxx - sx * sx / n, 0) * np.maximum(syy - sy * sy / n, 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self._store(dates, np.clip(cov / np.sqrt(var), -1, 1))
+
+
+def correlation_grid(signal, asset, lags, holds, workers=None):
+    """Correlation of returns(asset, hold) with lag(signal, lag + hold), as
+    in this module's main, for every lag and hold at once: both series are
+    aligned once, and each hold's row of the surface is a few matrix
+    products over the signal gathered at every lag. Rows are computed in
+    parallel across hold periods.
+    :param lags:    buy lags to try (points)
+    :param holds:   hold periods to try (points)
+    :param workers: number of processes (None for one per core, 1 to run
+                    in this process)
+    :return: array of correlations indexed [hold, lag] (nan where fewer
+             than two dates line up or a side is constant)
+    """
+    dates, at, st = np.intersect1d(asset.dates, signal.dates, assume_unique=True,
+                                   return_indices=True)
+    row = partial(_correlation_row, lags=np.asarray(lags), asset=np.asarray(asset.values),
+                  at=at, signal=np.asarray(signal.values), st=st)
+    if workers == 1:
+        return np.array([row(hold) for hold in holds])
+    holds = list(holds)
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(workers) as pool:
+        chunk = max(1, len(holds) // (4 * workers))
+        return np.array(list(pool.map(row, holds, chunksize=chunk)))
+
+def _correlation_row(hold, lags, asset, at, signal, st):
+    """correlations of returns(asset, hold) with lag(signal, lag + hold)
+    for each lag, over common dates at positions at in asset and st in
+    signal"""
+    first = np.searchsorted(at, hold)   # first date with a return
+    bought = asset[at[first:] - hold]
+    x = (asset[at[first:]] - bought) / bought
+    shifts = hold + lags
+    positions = st[first:][np.newaxis, :] - shifts[:, np.newaxis]
+    w = (positions >= 0).astype(float)   # dates where the lagged signal exists
+    y = (signal[np.maximum(positions, 0)] - signal.mean()) * w
+    x = x - (x.mean() if len(x) else 0.0)
+    n = w.sum(axis=1)
+    sx, sxx = w @ x, w @ (x * x)
+    sy, syy, sxy = y.sum(axis=1), (y * y).sum(axis=1), y @ x
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = sxy - sx * sy / n
+        var = np.maximum(sxx - sx * sx / n, 0) * np.maximum(syy - sy * sy / n, 0)
+        return np.where(n > 1, np.clip(cov / np.sqrt(var), -1, 1), np.nan)
 
 
 if __name__=='__main__':
@@ -266,7 +409,10 @@ if __name__=='__main__':
     signal_to_result_correlation = investment.correlation(compare_to)
     print(signal_to_result_correlation)
 
-    
-    
+    # every buy lag up to 30 and hold up to 60 days at once
+    lags, holds = np.arange(0, 31), np.arange(1, 61)
+    surface = correlation_grid(signal, gold, lags, holds)
+    best_hold, best_lag = np.unravel_index(np.nanargmax(np.abs(surface)), surface.shape)
+    print(holds[best_hold], lags[best_lag], surface[best_hold, best_lag])
+
 
-       